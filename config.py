@@ -121,6 +121,22 @@ class CInt(ConfigItem):
         )
 
 
+class CFloat(ConfigItem):
+    __type = ConfigItemType('float', float)
+
+    def __init__(self,
+                 default: any,
+                 *,
+                 mutable_runtime: bool = False,
+                 helptext: str = None):
+        super().__init__(
+            self.__type,
+            default,
+            mutable_runtime,
+            helptext
+        )
+
+
 class CStr(ConfigItem):
     __type = ConfigItemType('str', str)
 
@@ -217,6 +233,51 @@ class Config:
         """Your Giant Bomb API key. https://www.giantbomb.com/api"""
         return self.get('api.key').value
 
+    @property
+    def API_FORMAT(self):
+        """The format requested from the API. Either xml or json."""
+        return self.get('api.format').value
+
+    @property
+    def API_BURST_SIZE(self):
+        """Integer. The number of API requests that may be sent back to back before pacing kicks in."""
+        return self.get('api.rate limit.burst size').value
+
+    @property
+    def API_REFILL_RATE(self):
+        """Float. The long-run number of API requests allowed per second."""
+        return self.get('api.rate limit.refill rate').value
+
+    @property
+    def API_CACHE_ENABLED(self):
+        """Boolean. Whether API responses are cached."""
+        return self.get('api.cache.enabled').value
+
+    @property
+    def API_CACHE_MAX_ENTRIES(self):
+        """Integer. The maximum number of API responses kept in the cache."""
+        return self.get('api.cache.max entries').value
+
+    @property
+    def API_CACHE_MAX_SIZE(self):
+        """Integer. The maximum total size of API responses kept in the cache. Units are kilobytes."""
+        return self.get('api.cache.max size').value
+
+    @property
+    def API_CACHE_STALE_WHILE_REVALIDATE(self):
+        """Boolean. Whether expired API responses are served while a fresh copy is requested in the background."""
+        return self.get('api.cache.stale while revalidate').value
+
+    def API_CACHE_TTL(self, resource: str):
+        """
+        Integer. The number of seconds an API response for the given resource stays fresh. Falls back to the default
+        TTL for resources without their own setting. Units are seconds.
+        """
+        try:
+            return self.get(f'api.cache.ttl.{resource}').value
+        except ValueError:
+            return self.get('api.cache.ttl.default').value
+
     @property
     def DATABASE_DIR(self):
         """
@@ -231,12 +292,119 @@ class Config:
         v = self.get('database.name').value
         return v if v.endswith('.db') else f'{v}.db'
 
+    @property
+    def DATABASE_OPERATIONAL_NAME(self):
+        """The name of the database file of the download queue, download history and files. Stored in DATABASE_DIR."""
+        v = self.get('database.operational name').value
+        return v if v.endswith('.db') else f'{v}.db'
+
+    @property
+    def DATABASE_CACHE_NAME(self):
+        """The name of the API response cache database file. Stored in DATABASE_DIR."""
+        v = self.get('database.cache name').value
+        return v if v.endswith('.db') else f'{v}.db'
+
+    @property
+    def DATABASE_JOURNAL_MODE(self):
+        """The sqlite journal mode. WAL lets the web server read while downloads and ingest write."""
+        return self.get('database.performance.journal mode').value
+
+    @property
+    def DATABASE_SYNCHRONOUS(self):
+        """How often sqlite waits for writes to reach the disk. Either off, normal, full or extra."""
+        return self.get('database.performance.synchronous').value
+
+    @property
+    def DATABASE_CACHE_SIZE(self):
+        """Integer. The size of the sqlite page cache of each connection. Units are kilobytes."""
+        return self.get('database.performance.cache size').value
+
+    @property
+    def DATABASE_MMAP_SIZE(self):
+        """Integer. How much of the database sqlite reads through a memory map. Units are megabytes."""
+        return self.get('database.performance.mmap size').value
+
+    @property
+    def DATABASE_TEMP_STORE(self):
+        """Where sqlite keeps temporary tables and indexes. Either default, file or memory."""
+        return self.get('database.performance.temp store').value
+
+    @property
+    def DATABASE_BUSY_TIMEOUT(self):
+        """Float. How long a connection waits for another connection's lock. Units are seconds."""
+        return self.get('database.performance.busy timeout').value
+
+    @property
+    def DOWNLOAD_WORKERS(self):
+        """Integer. The number of downloads that run at the same time."""
+        return self.get('downloads.workers').value
+
+    @property
+    def DOWNLOAD_HOST_LIMIT(self):
+        """Integer. The maximum number of downloads that run at the same time from a single host."""
+        return self.get('downloads.host limit').value
+
+    @property
+    def DOWNLOAD_SEGMENTS(self):
+        """Integer. The number of connections a large video is downloaded over."""
+        return self.get('downloads.segments').value
+
+    @property
+    def DOWNLOAD_SEGMENT_THRESHOLD(self):
+        """Integer. Videos at least this large are downloaded over several connections. Units are megabytes."""
+        return self.get('downloads.segment threshold').value
+
+    @property
+    def DOWNLOAD_SEGMENT_RETRIES(self):
+        """Integer. The number of times a segment of a download is retried before the download fails."""
+        return self.get('downloads.segment retries').value
+
+    @property
+    def DOWNLOAD_PROGRESS_INTERVAL(self):
+        """Float. The number of seconds between writes of the progress of running downloads to the database."""
+        return self.get('downloads.progress interval').value
+
+    @property
+    def DOWNLOAD_SCHEDULER(self):
+        """The policy that decides the order queued downloads start in."""
+        return self.get('downloads.scheduler').value
+
+    @property
+    def DOWNLOAD_SMALL_FILE_WORKERS(self):
+        """Integer. The number of small files, such as images, downloaded at the same time."""
+        return self.get('downloads.small file workers').value
+
+    @property
+    def DOWNLOAD_SMALL_FILE_SIZE(self):
+        """Integer. Downloads known to be smaller than this are handled as small files. Units are kilobytes."""
+        return self.get('downloads.small file size').value
+
     @property
     def FILE_ROOT(self):
         """The root directory used to store files like videos and images."""
         v = self.get('file root').value
         return v if os.path.isabs(v) else os.path.join(self.SERVER_ROOT, v)
 
+    @property
+    def HTTP_POOL_SIZE(self):
+        """Integer. The maximum number of connections kept open to each host."""
+        return self.get('network.pool size').value
+
+    @property
+    def HTTP_KEEP_ALIVE(self):
+        """Boolean. Whether connections are kept open and reused between requests."""
+        return self.get('network.keep alive').value
+
+    @property
+    def HTTP_CONNECT_TIMEOUT(self):
+        """Float. The number of seconds to wait for a connection to be established. Units are seconds."""
+        return self.get('network.connect timeout').value
+
+    @property
+    def HTTP_READ_TIMEOUT(self):
+        """Float. The number of seconds to wait for data from an open connection. Units are seconds."""
+        return self.get('network.read timeout').value
+
     @property
     def LOG_DIR(self):
         """The directory where gbmm stores logs. If not an absolute path, this is relative to SERVER_ROOT."""
@@ -301,7 +469,55 @@ class Config:
                          helptext='Your Giant Bomb API key. https://www.giantbomb.com/api.'),
                 'version':
                     CStr('1.0', mutable_runtime=True,
-                         helptext='The Giant Bomb API version. This should be 1.0.')
+                         helptext='The Giant Bomb API version. This should be 1.0.'),
+                'format':
+                    CSelect('xml', ['xml', 'json'], mutable_runtime=True,
+                            helptext='The format requested from the Giant Bomb API. JSON is faster to decode, '
+                                     'especially when orjson is installed.'),
+                'rate limit': {
+                    'burst size':
+                        CInt(5, mutable_runtime=True,
+                             helptext='The number of API requests that may be sent back to back before pacing kicks '
+                                      'in.'),
+                    'refill rate':
+                        CFloat(0.9, mutable_runtime=True,
+                               helptext='The long-run number of API requests allowed per second. Giant Bomb blocks '
+                                        'clients that exceed roughly one request per second.')
+                    },
+                'cache': {
+                    'enabled':
+                        CBool(True, mutable_runtime=True,
+                              helptext='Whether API responses are cached.'),
+                    'max entries':
+                        CInt(5000, mutable_runtime=True,
+                             helptext='The maximum number of API responses kept in the cache.'),
+                    'max size':
+                        CInt(100000, mutable_runtime=True,
+                             helptext='The maximum total size of API responses kept in the cache. Units are '
+                                      'kilobytes.'),
+                    'stale while revalidate':
+                        CBool(True, mutable_runtime=True,
+                              helptext='Whether expired API responses are served immediately while a fresh copy is '
+                                       'requested in the background.'),
+                    'ttl': {
+                        'default':
+                            CInt(3600, mutable_runtime=True,
+                                 helptext='The number of seconds an API response stays fresh when its resource has '
+                                          'no setting of its own.'),
+                        'videos':
+                            CInt(600, mutable_runtime=True,
+                                 helptext='The number of seconds a page of videos stays fresh.'),
+                        'video':
+                            CInt(86400, mutable_runtime=True,
+                                 helptext='The number of seconds a single video stays fresh.'),
+                        'video_shows':
+                            CInt(86400, mutable_runtime=True,
+                                 helptext='The number of seconds a page of video shows stays fresh.'),
+                        'video_categories':
+                            CInt(86400, mutable_runtime=True,
+                                 helptext='The number of seconds a page of video categories stays fresh.')
+                        }
+                    }
                 },
             'file root':
                 CStr(file_root,
@@ -314,7 +530,92 @@ class Config:
                                   'relative to the server root.'),
                 'name':
                     CStr(f'{ConfigStatic.SERVER_NAME}.db',
-                         helptext='The name of the database file.')
+                         helptext='The name of the database file.'),
+                'operational name':
+                    CStr(f'{ConfigStatic.SERVER_NAME}-operational.db',
+                         helptext='The name of the database file of the download queue, download history and '
+                                  'files. Stored in the database directory.'),
+                'cache name':
+                    CStr(f'{ConfigStatic.SERVER_NAME}-cache.db',
+                         helptext='The name of the API response cache database file. Stored in the database '
+                                  'directory.'),
+                'performance': {
+                    'journal mode':
+                        CSelect('wal', ['wal', 'delete', 'truncate', 'persist', 'memory'],
+                                helptext='The sqlite journal mode. wal lets the web server read while downloads and '
+                                         'ingest write. Takes effect on restart.'),
+                    'synchronous':
+                        CSelect('normal', ['off', 'normal', 'full', 'extra'],
+                                helptext='How often sqlite waits for writes to reach the disk. normal is safe with wal. '
+                                         'Takes effect on restart.'),
+                    'cache size':
+                        CInt(64000,
+                             helptext='The size of the sqlite page cache of each connection. Units are kilobytes. '
+                                      'Takes effect on restart.'),
+                    'mmap size':
+                        CInt(256,
+                             helptext='How much of the database sqlite reads through a memory map. 0 disables it. '
+                                      'Units are megabytes. Takes effect on restart.'),
+                    'temp store':
+                        CSelect('memory', ['default', 'file', 'memory'],
+                                helptext='Where sqlite keeps temporary tables and indexes. Takes effect on restart.'),
+                    'busy timeout':
+                        CFloat(5,
+                               helptext='How long a connection waits for another connection to release its lock '
+                                        'before failing. Units are seconds. Takes effect on restart.')
+                    }
+                },
+            'network': {
+                'pool size':
+                    CInt(10,
+                         helptext='The maximum number of connections kept open to each host.'),
+                'keep alive':
+                    CBool(True,
+                          helptext='Whether connections are kept open and reused between requests.'),
+                'connect timeout':
+                    CFloat(10, mutable_runtime=True,
+                           helptext='The number of seconds to wait for a connection to be established.'),
+                'read timeout':
+                    CFloat(60, mutable_runtime=True,
+                           helptext='The number of seconds to wait for data from an open connection.')
+                },
+            'downloads': {
+                'workers':
+                    CInt(3, mutable_runtime=True,
+                         helptext='The number of downloads that run at the same time.'),
+                'scheduler':
+                    CSelect('priority', ['priority', 'fifo', 'shortest first', 'round robin'], mutable_runtime=True,
+                            helptext='The order queued downloads start in. priority: lowest priority first, then '
+                                     'oldest first. fifo: oldest first. shortest first: smallest expected size first, '
+                                     'estimated from the length of videos. round robin: take turns between video '
+                                     'shows.'),
+                'host limit':
+                    CInt(2, mutable_runtime=True,
+                         helptext='The maximum number of downloads that run at the same time from a single host.'),
+                'small file workers':
+                    CInt(8, mutable_runtime=True,
+                         helptext='The number of small files, such as images, downloaded at the same time. Small files '
+                                  'are downloaded separately from videos so they never wait behind them.'),
+                'small file size':
+                    CInt(2000, mutable_runtime=True,
+                         helptext='Downloads known to be smaller than this are handled as small files. Images are '
+                                  'always handled as small files. Units are kilobytes.'),
+                'segments':
+                    CInt(4, mutable_runtime=True,
+                         helptext='The number of connections a large video is downloaded over. Set to 1 to download '
+                                  'every file in a single stream.'),
+                'segment threshold':
+                    CInt(100, mutable_runtime=True,
+                         helptext='Videos at least this large are downloaded over several connections. Units are '
+                                  'megabytes.'),
+                'segment retries':
+                    CInt(3, mutable_runtime=True,
+                         helptext='The number of times a segment of a download is retried before the download '
+                                  'fails.'),
+                'progress interval':
+                    CFloat(5, mutable_runtime=True,
+                           helptext='The number of seconds between writes of the progress of running downloads to the '
+                                    'database. Live progress is always available from memory.')
                 },
             'logging': {
                 'directory':
@@ -0,0 +1,122 @@
+"""
+Compares the download write loops: a new bytes object per chunk from iter_content, against reading into a reusable
+buffer with BodyReader and preallocating the file. Each loop runs in its own process so peak RSS is measured per loop.
+The runs of a loop share a session, and the number of connections it opened shows whether the loop returns its
+connection to the pool for the next request to reuse.
+
+Usage: python gbmm-tests/bench_download_write.py [--size-mb N] [--runs N]
+"""
+import argparse
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import requests  # noqa: E402
+
+from server.body_reader import BodyReader, preallocate  # noqa: E402
+
+chunk_size = 10 * 1024 * 1024  # 10 MB, the downloader's chunk size
+block = os.urandom(1024 * 1024)
+
+
+class BodyHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    connections = 0
+    '''Connections accepted by the server. urllib3 reconnects a closed connection object without counting it.'''
+    connections_lock = threading.Lock()
+
+    def setup(self):
+        with BodyHandler.connections_lock:
+            BodyHandler.connections += 1
+        super().setup()
+
+    def do_GET(self):
+        size = int(self.path.strip('/')) * len(block)
+        self.send_response(200)
+        self.send_header('Content-Type', 'video/mp4')
+        self.send_header('Content-Length', str(size))
+        self.end_headers()
+        for _ in range(size // len(block)):
+            self.wfile.write(block)
+
+    def log_message(self, *args):
+        pass
+
+
+def write_iter_content(response: requests.Response, handle):
+    for data in response.iter_content(chunk_size):
+        handle.write(data)
+
+
+def write_body_reader(response: requests.Response, handle):
+    preallocate(handle, int(response.headers['Content-Length']))
+    for data in BodyReader(response, chunk_size).chunks():
+        handle.write(data)
+    handle.truncate()
+
+
+loops = {
+    'iter_content': write_iter_content,
+    'BodyReader': write_body_reader
+}
+
+
+def run_loop(name: str, url: str, size_mb: int, runs: int):
+    """Runs a write loop and prints CPU seconds per MB and peak RSS in MB."""
+    path = os.path.join(tempfile.mkdtemp(prefix='gbmm-bench-'), 'download.bin')
+    cpu = 0.0
+    wall = 0.0
+    session = requests.Session()
+    for _ in range(runs):
+        with session.get(url, stream=True) as response, open(path, 'wb') as handle:
+            cpu_start = time.process_time()
+            wall_start = time.perf_counter()
+            loops[name](response, handle)
+            cpu += time.process_time() - cpu_start
+            wall += time.perf_counter() - wall_start
+        assert os.path.getsize(path) == size_mb * len(block)
+    os.remove(path)
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f'{cpu / (runs * size_mb) * 1000} {size_mb * runs / wall} {peak_rss}')
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--size-mb', type=int, default=256)
+    arg_parser.add_argument('--runs', type=int, default=3)
+    arg_parser.add_argument('--loop', choices=list(loops.keys()), help=argparse.SUPPRESS)
+    arg_parser.add_argument('--url', help=argparse.SUPPRESS)
+    args = arg_parser.parse_args()
+
+    if args.loop is not None:
+        run_loop(args.loop, args.url, args.size_mb, args.runs)
+        return
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), BodyHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f'http://127.0.0.1:{server.server_port}/{args.size_mb}'
+
+    print(f'{args.size_mb} MB body, {args.runs} runs per loop')
+    print(f'{"loop":<16}{"CPU ms per MB":>16}{"MB/s":>10}{"peak RSS MB":>14}{"connections":>14}')
+    for name in loops.keys():
+        BodyHandler.connections = 0
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--loop', name, '--url', url, '--size-mb', str(args.size_mb),
+             '--runs', str(args.runs)],
+            check=True, capture_output=True, text=True
+        ).stdout
+        cpu_ms, rate, peak_rss = (float(value) for value in output.split())
+        print(f'{name:<16}{cpu_ms:>16.2f}{rate:>10.1f}{peak_rss:>14.1f}{BodyHandler.connections:>14}')
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+"""
+Measures how long it takes to ingest a page of API results into the database with database.from_api.
+
+Usage: python gbmm-tests/bench_from_api.py [--format xml|json] [--iterations N] [--items N]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+# The database is created on import, so point gbmm at a scratch directory first
+os.environ['GBMM_ROOT'] = tempfile.mkdtemp(prefix='gbmm-bench-')
+
+from server import api_format  # noqa: E402
+from server.api_format import ResponseFormat  # noqa: E402
+from server.database import Session, Video, from_api  # noqa: E402
+from bench_response_format import build_page, to_xml  # noqa: E402
+
+
+def page_results(page: dict, response_format: str):
+    if response_format == ResponseFormat.XML:
+        body = f'<?xml version="1.0" encoding="utf-8"?>{to_xml(page, "response")}'.encode('utf-8')
+    else:
+        body = json.dumps(page).encode('utf-8')
+    return api_format.children(api_format.get_node(api_format.parse(body, response_format), 'results'))
+
+
+def ingest(results, commit: bool) -> float:
+    session = Session()
+    try:
+        start = time.perf_counter()
+        from_api(session, Video, results)
+        session.flush()
+        elapsed = time.perf_counter() - start
+        if commit:
+            session.commit()
+        else:
+            session.rollback()
+        return elapsed
+    finally:
+        session.close()
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--format', choices=[ResponseFormat.XML, ResponseFormat.JSON], default=ResponseFormat.XML)
+    arg_parser.add_argument('--iterations', type=int, default=20)
+    arg_parser.add_argument('--items', type=int, default=100)
+    args = arg_parser.parse_args()
+
+    results = page_results(build_page(args.items), args.format)
+
+    # Warm up
+    ingest(results, commit=False)
+
+    new_times = [ingest(results, commit=False) for _ in range(args.iterations)]
+    ingest(results, commit=True)
+    existing_times = [ingest(results, commit=False) for _ in range(args.iterations)]
+
+    print(f'{args.items} {args.format} results per page, {args.iterations} iterations')
+    print(f'New rows:      {min(new_times) * 1000:8.2f} ms best, {sum(new_times) / len(new_times) * 1000:8.2f} ms mean')
+    print(f'Existing rows: {min(existing_times) * 1000:8.2f} ms best, '
+          f'{sum(existing_times) / len(existing_times) * 1000:8.2f} ms mean')
+
+
+if __name__ == '__main__':
+    main()
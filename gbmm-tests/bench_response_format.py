@@ -0,0 +1,146 @@
+"""
+Compares parse time and memory per page of API results for each response format.
+
+Usage: python gbmm-tests/bench_response_format.py [--pages N] [--items N]
+"""
+import argparse
+import gc
+import json
+import os
+import sys
+import time
+from xml.sax.saxutils import escape
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from server import api_format  # noqa: E402
+from server.api_format import ResponseFormat  # noqa: E402
+
+image_fields = ['icon_url', 'medium_url', 'original_url', 'screen_url', 'screen_large_url', 'small_url', 'super_url',
+                'thumb_url', 'tiny_url']
+
+
+def build_video(i: int) -> dict:
+    video = {
+        'api_detail_url': f'https://www.giantbomb.com/api/video/2300-{i}/',
+        'deck': 'A brief summary of the video that runs for a sentence or two. ' * 2,
+        'guid': f'2300-{i}',
+        'hd_url': f'https://giantbomb-pdl.akamaized.net/2021/01/01/vf_video_{i}_hd.mp4',
+        'high_url': f'https://giantbomb-pdl.akamaized.net/2021/01/01/vf_video_{i}_high.mp4',
+        'low_url': f'https://giantbomb-pdl.akamaized.net/2021/01/01/vf_video_{i}_low.mp4',
+        'embed_player': f'https://www.giantbomb.com/videos/embed/{i}/',
+        'id': i,
+        'length_seconds': 3600 + i,
+        'name': f'Video number {i}',
+        'publish_date': '2021-01-01 12:00:00',
+        'site_detail_url': f'https://www.giantbomb.com/videos/video-{i}/2300-{i}/',
+        'url': f'vf_video_{i}.mp4',
+        'user': 'someone',
+        'youtube_id': 'dQw4w9WgXcQ',
+        'saved_time': None,
+        'premium': 'false',
+        'hosts': 'host one, host two',
+        'crew': 'crew one',
+        'image': {f: f'https://www.giantbomb.com/a/uploads/{f}/{i}.jpg' for f in image_fields},
+        'video_show': {'id': i % 40, 'title': f'Show {i % 40}', 'position': i % 40}
+    }
+    video['image']['image_tags'] = 'All Images'
+    return video
+
+
+def to_xml(node: any, tag: str) -> str:
+    if isinstance(node, dict):
+        inner = ''.join(to_xml(v, k) for k, v in node.items())
+    elif isinstance(node, list):
+        inner = ''.join(to_xml(v, tag.rstrip('s')) for v in node)
+    elif node is None:
+        inner = ''
+    else:
+        inner = f'<![CDATA[{node}]]>' if isinstance(node, str) else escape(str(node))
+    return f'<{tag}>{inner}</{tag}>'
+
+
+def build_page(items: int) -> dict:
+    return {
+        'error': 'OK',
+        'limit': items,
+        'offset': 0,
+        'number_of_page_results': items,
+        'number_of_total_results': items * 100,
+        'status_code': 1,
+        'results': [build_video(i) for i in range(items)],
+        'version': '1.0'
+    }
+
+
+def walk(response):
+    """Reads every field of every result, the way ingest does."""
+    for result in api_format.children(api_format.get_node(response, 'results')):
+        for key in ('id', 'name', 'deck', 'hd_url', 'length_seconds', 'publish_date', 'premium'):
+            api_format.get_value(result, key)
+        image = api_format.get_node(result, 'image')
+        for key in image_fields:
+            api_format.get_value(image, key)
+
+
+def rss_bytes() -> int:
+    with open('/proc/self/statm') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def measure(body: bytes, response_format: str, pages: int):
+    # Warm up
+    walk(api_format.parse(body, response_format))
+
+    start = time.perf_counter()
+    for _ in range(pages):
+        api_format.parse(body, response_format)
+    parse_time = (time.perf_counter() - start) / pages
+
+    start = time.perf_counter()
+    for _ in range(pages):
+        walk(api_format.parse(body, response_format))
+    walk_time = (time.perf_counter() - start) / pages
+
+    # Hold a number of parsed pages at once and measure how much the process grew
+    gc.collect()
+    before = rss_bytes()
+    held = [api_format.parse(body, response_format) for _ in range(pages)]
+    for response in held:
+        walk(response)
+    memory = (rss_bytes() - before) / pages
+    del held
+    gc.collect()
+    return parse_time, walk_time, memory
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__)
+    arg_parser.add_argument('--pages', type=int, default=50)
+    arg_parser.add_argument('--items', type=int, default=100)
+    args = arg_parser.parse_args()
+
+    page = build_page(args.items)
+    xml_body = f'<?xml version="1.0" encoding="utf-8"?>{to_xml(page, "response")}'.encode('utf-8')
+    json_body = json.dumps(page).encode('utf-8')
+
+    candidates = [('xml (lxml.objectify)', xml_body, ResponseFormat.XML, None)]
+    if api_format.orjson is not None:
+        candidates.append(('json (orjson)', json_body, ResponseFormat.JSON, api_format.orjson))
+    candidates.append(('json (json)', json_body, ResponseFormat.JSON, None))
+
+    print(f'{args.items} results per page, {args.pages} pages per measurement')
+    print(f'{"format":<22}{"body KB":>10}{"parse ms":>12}{"parse+walk ms":>16}{"KB per page":>14}')
+    for name, body, response_format, fast_parser in candidates:
+        saved = api_format.orjson
+        api_format.orjson = fast_parser
+        try:
+            parse_time, walk_time, memory = measure(body, response_format, args.pages)
+        finally:
+            api_format.orjson = saved
+        print(f'{name:<22}{len(body) / 1000:>10.1f}{parse_time * 1000:>12.2f}{walk_time * 1000:>16.2f}'
+              f'{memory / 1000:>14.1f}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+import json
+from typing import Callable
+from urllib.parse import urlsplit, parse_qsl
+
+from lxml import objectify
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+class ResponseFormat:
+    """
+    Formats the API can respond with. XML is decoded into an ``lxml.objectify`` tree and JSON into plain dicts and
+    lists. Code that reads responses uses the functions in this module so it works with either format.
+    """
+    XML = 'xml'
+    JSON = 'json'
+
+
+def format_of(url: str) -> str:
+    """Returns the response format requested by a URL. The API responds with XML when no format is given."""
+    for k, v in parse_qsl(urlsplit(url).query):
+        if k == 'format':
+            return v
+    return ResponseFormat.XML
+
+
+def parse(body: bytes, response_format: str):
+    """Decodes a raw response body. Uses orjson for JSON when it is installed."""
+    if response_format == ResponseFormat.JSON:
+        if orjson is not None:
+            return orjson.loads(body)
+        return json.loads(body)
+    parser = objectify.makeparser(encoding='utf-8')
+    return objectify.fromstring(body, parser)
+
+
+def has_field(node, name: str) -> bool:
+    if isinstance(node, dict):
+        return name in node
+    return hasattr(node, name)
+
+
+def get_value(node, name: str, default: any = None):
+    """Returns the Python value of a field, or ``default`` if the node does not have the field."""
+    if isinstance(node, dict):
+        return node.get(name, default)
+    child = getattr(node, name, None)
+    if child is None:
+        return default
+    return child.pyval
+
+
+def value_getter(node) -> Callable[[str], any]:
+    """
+    Returns a function that takes a field name and returns the Python value of that field of ``node``, or None. Used
+    to read many fields of the same node without checking its format for each one.
+    """
+    if isinstance(node, dict):
+        return node.get
+
+    def get_xml_value(name: str):
+        child = getattr(node, name, None)
+        return None if child is None else child.pyval
+    return get_xml_value
+
+
+def get_node(node, name: str):
+    """Returns a nested node, such as the results of a response or the image of a video, or None."""
+    if isinstance(node, dict):
+        return node.get(name, None)
+    return getattr(node, name, None)
+
+
+def children(node) -> list:
+    """Returns the items of a results node."""
+    if node is None:
+        return []
+    if isinstance(node, list):
+        return node
+    if isinstance(node, dict):
+        return [node]
+    return [c for c in node.iterchildren()]
+
+
+def is_container(node) -> bool:
+    """
+    Returns whether an XML node is a list of results, such as the ``video_categories`` of a video. The items of a list
+    are elements with fields of their own, all with the same tag. The fields of a single result are plain values.
+    """
+    items = [c for c in node.iterchildren()]
+    return len(items) > 0 and len({c.tag for c in items}) == 1 and all(c.countchildren() > 0 for c in items)
+
+
+def single(node):
+    """
+    Returns the node itself, or the first item when the node is a list of results. XML lists are elements that contain
+    the items, so they are unwrapped the same way as JSON lists.
+    """
+    if isinstance(node, list):
+        return node[0] if len(node) > 0 else None
+    if node is None or isinstance(node, dict):
+        return node
+    # Like an empty list or null in JSON, an empty element has no result
+    if node.countchildren() == 0:
+        return None
+    return next(node.iterchildren()) if is_container(node) else node
+
+
+def is_empty(node) -> bool:
+    if node is None:
+        return True
+    if isinstance(node, (list, dict)):
+        return len(node) == 0
+    return node.countchildren() == 0
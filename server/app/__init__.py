@@ -38,6 +38,15 @@ def create_app():
 
     server.logger.info(f'Starting {config.SERVER_NAME} version {config.SERVER_VERSION}.')
 
+    # Bring the database up to date before anything else uses it
+    from server import migrations
+    migrations.upgrade()
+
+    from server.database import engine, operational_engine
+    from server.sqlite_pragmas import active_pragmas
+    server.logger.info(f'Catalog database settings: {active_pragmas(engine)}')
+    server.logger.info(f'Operational database settings: {active_pragmas(operational_engine)}')
+
     # Blueprints
     from . import index
     server.register_blueprint(index.bp)
@@ -57,6 +66,10 @@ def create_app():
     server.register_blueprint(startup.bp)
     from . import media
     server.register_blueprint(media.bp)
+    from . import status
+    server.register_blueprint(status.bp)
+    from . import files
+    server.register_blueprint(files.bp)
 
     settings.initialize()
 
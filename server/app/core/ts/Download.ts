@@ -1,10 +1,11 @@
 import Progress from './Progress';
 import File from "./File";
 import API, {validResponseData} from "./gbmmapi/API";
-import {DownloadEnqueueParams, DownloadResponseData, DownloadsGetFilters} from "./gbmmapi/DownloadsAPI";
+import {DownloadEnqueueParams, DownloadProgressData, DownloadResponseData, DownloadsGetFilters} from "./gbmmapi/DownloadsAPI";
 import Loadable from "./Loadable";
 import Definitions from "./Definitions";
 import ResultList from "./ResultList";
+import DownloadMonitor from "./DownloadMonitor";
 
 export default class Download extends Loadable {
     // Serialized fields
@@ -21,6 +22,7 @@ export default class Download extends Loadable {
     public startTime: string
     public finishTime: string
     public url: string
+    public priority: number = 0
     public sizeBytes: number = 0
     public downloadedBytes: number = 0
     public contentType: string
@@ -31,7 +33,6 @@ export default class Download extends Loadable {
     public valid: boolean = false
     public definitions: Definitions
 
-    private interval: number = -1
     private monitoring: boolean = false
     private refreshing: boolean = false
 
@@ -76,6 +77,27 @@ export default class Download extends Loadable {
         return download;
     }
 
+    public pause = async () => {
+        const response = await API.downloads.pause({id: this.id});
+        this.updateFromResponseData(response.data);
+    }
+
+    public resume = async () => {
+        const response = await API.downloads.resume({id: this.id});
+        this.updateFromResponseData(response.data);
+        this.startMonitor();
+    }
+
+    public cancel = async () => {
+        const response = await API.downloads.cancel({id: this.id});
+        this.updateFromResponseData(response.data);
+    }
+
+    public reprioritize = async (priority: number) => {
+        const response = await API.downloads.reprioritize({id: this.id, priority: priority});
+        this.updateFromResponseData(response.data);
+    }
+
     private updateFromResponseData(data: DownloadResponseData) {
         if (!validResponseData(data)) return;
         this.valid = true;
@@ -89,25 +111,32 @@ export default class Download extends Loadable {
             this.file = new File(data.file, this.definitions);
         }
         this.status = data.status;
+        this.priority = data.priority;
         this.sizeBytes = data.size_bytes;
         this.downloadedBytes = data.downloaded_bytes;
         this.createdTime = data.created_time;
         this.startTime = data.start_time;
         this.finishTime = data.finish_time;
-        this.progress.update(this.sizeBytes, this.downloadedBytes);
+        this.progress.update(this.sizeBytes, this.downloadedBytes, data.rate_bytes, data.eta_seconds);
+    }
+
+    public updateFromProgressData(data: DownloadProgressData) {
+        this.sizeBytes = data.size_bytes;
+        this.downloadedBytes = data.downloaded_bytes;
+        this.progress.update(this.sizeBytes, this.downloadedBytes, data.rate_bytes, data.eta_seconds);
     }
 
     public startMonitor = () => {
         if (!this.monitoring && (this.isQueued || this.isInProgress)) {
             this.monitoring = true;
-            this.interval = window.setInterval(this.refresh, 1000);
+            DownloadMonitor.add(this);
         }
     }
 
     public stopMonitor = () => {
         if (this.monitoring) {
             this.monitoring = false;
-            window.clearInterval(this.interval);
+            DownloadMonitor.remove(this);
         }
     }
 
@@ -121,6 +150,9 @@ export default class Download extends Loadable {
                     this.stopMonitor();
                 }
                 this.refreshing = false;
+            })
+            .catch(() => {
+                this.refreshing = false;
             });
     }
 
@@ -0,0 +1,66 @@
+import type Download from "./Download";
+import API from "./gbmmapi/API";
+import {DownloadProgressData} from "./gbmmapi/DownloadsAPI";
+
+const POLL_INTERVAL = 1000
+const QUEUED_REFRESH_POLLS = 10
+
+// Keeps monitored downloads up to date with a single poll of the live progress of every running download, however many
+// downloads are on the page. A download is only fetched again when its status changes.
+export default class DownloadMonitor {
+    private static downloads: {[id: number]: Download} = {}
+    private static count: number = 0
+    private static interval: number = -1
+    private static polling: boolean = false
+    private static polls: number = 0
+
+    public static add(download: Download) {
+        if (!(download.id in DownloadMonitor.downloads)) {
+            DownloadMonitor.count++;
+        }
+        DownloadMonitor.downloads[download.id] = download;
+        if (DownloadMonitor.interval === -1) {
+            DownloadMonitor.interval = window.setInterval(DownloadMonitor.poll, POLL_INTERVAL);
+        }
+    }
+
+    public static remove(download: Download) {
+        if (DownloadMonitor.downloads[download.id] === download) {
+            delete DownloadMonitor.downloads[download.id];
+            DownloadMonitor.count--;
+        }
+        if (DownloadMonitor.count === 0 && DownloadMonitor.interval !== -1) {
+            window.clearInterval(DownloadMonitor.interval);
+            DownloadMonitor.interval = -1;
+        }
+    }
+
+    private static poll = async () => {
+        if (DownloadMonitor.polling) return;
+        DownloadMonitor.polling = true;
+        try {
+            const response = await API.downloads.progress();
+            const running: {[id: number]: DownloadProgressData} = {};
+            for (let progress of response.data.results) {
+                running[progress.id] = progress;
+            }
+            // Queued downloads that start and finish between two polls never show up as running, such as small
+            // files, so queued downloads are also fetched again every few polls
+            const refreshQueued = ++DownloadMonitor.polls % QUEUED_REFRESH_POLLS === 0;
+            for (let id of Object.keys(DownloadMonitor.downloads)) {
+                const download = DownloadMonitor.downloads[parseInt(id)];
+                const progress = running[download.id];
+                if (progress !== undefined && download.isInProgress) {
+                    download.updateFromProgressData(progress);
+                }
+                else if (progress !== undefined || download.isInProgress || refreshQueued) {
+                    // The download has started, or has stopped running because it finished, failed or was paused
+                    download.refresh();
+                }
+            }
+        }
+        finally {
+            DownloadMonitor.polling = false;
+        }
+    }
+}
@@ -11,6 +11,9 @@ export default class File {
     public path: string
     public sizeBytes: number
     public contentType: string
+    public url: string
+    public contentHash: string
+    public hashedMtime: number
 
     public constructor(data: FileResponseData, definitions: Definitions) {
         this.id = data.id;
@@ -26,5 +29,8 @@ export default class File {
         this.path = data.path;
         this.sizeBytes = data.size_bytes;
         this.contentType = data.content_type;
+        this.url = data.url;
+        this.contentHash = data.content_hash;
+        this.hashedMtime = data.hashed_mtime;
     }
 }
\ No newline at end of file
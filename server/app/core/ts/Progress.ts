@@ -7,6 +7,7 @@ export default class Progress {
     public history: ProgressHistoryEntry[] = []
     public rate: number = 0
     public unit: string = ''
+    public etaSeconds: number | null = null
 
     get percentString() {
         if (this.ratio < 0 || isNaN(this.ratio)) {
@@ -26,14 +27,36 @@ export default class Progress {
         }
     }
 
-    updateRate(downloadedBytes: number) {
-        this.history.push({time: Date.now(), downloadedBytes: downloadedBytes});
-        if (this.history.length > HISTORY_SIZE) {
-            this.history.shift();
-        }
-        let delta = this.history[this.history.length - 1].downloadedBytes - this.history[0].downloadedBytes;
-        let duration = this.history[this.history.length - 1].time - this.history[0].time;
-        this.rate = delta / (duration / 1000);
+    get etaString() {
+        if (this.etaSeconds === null) {
+            return '';
+        }
+        const seconds = Math.round(this.etaSeconds);
+        if (seconds < 60) {
+            return `${seconds}s`;
+        }
+        else if (seconds < 3600) {
+            return `${Math.floor(seconds / 60)}m ${seconds % 60}s`;
+        }
+        else {
+            return `${Math.floor(seconds / 3600)}h ${Math.floor(seconds % 3600 / 60)}m`;
+        }
+    }
+
+    updateRate(downloadedBytes: number, rateBytes?: number | null) {
+        if (rateBytes !== undefined && rateBytes !== null) {
+            // The server measures the rate of running downloads itself
+            this.rate = rateBytes;
+        }
+        else {
+            this.history.push({time: Date.now(), downloadedBytes: downloadedBytes});
+            if (this.history.length > HISTORY_SIZE) {
+                this.history.shift();
+            }
+            let delta = this.history[this.history.length - 1].downloadedBytes - this.history[0].downloadedBytes;
+            let duration = this.history[this.history.length - 1].time - this.history[0].time;
+            this.rate = delta / (duration / 1000);
+        }
         this.unit = 'B/s';
         ['KB/s', 'MB/s'].forEach((unit) => {
             if (this.rate / 1000 > 1) {
@@ -43,11 +66,12 @@ export default class Progress {
         })
     }
 
-    update(sizeBytes: number, downloadedBytes: number) {
+    update(sizeBytes: number, downloadedBytes: number, rateBytes?: number | null, etaSeconds?: number | null) {
         this.sizeBytes = sizeBytes;
         this.downloadedBytes = downloadedBytes;
         this.ratio = downloadedBytes / sizeBytes;
-        this.updateRate(downloadedBytes);
+        this.etaSeconds = etaSeconds ?? null;
+        this.updateRate(downloadedBytes, rateBytes);
     }
 }
 
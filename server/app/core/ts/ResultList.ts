@@ -14,7 +14,8 @@ export default class ResultList<T> extends Array<T> {
             offset: data?.metadata?.offset,
             current_page: data?.metadata?.current_page,
             total_pages: data?.metadata?.total_pages,
-            total_results: data?.metadata?.total_results
+            total_results: data?.metadata?.total_results,
+            next_cursor: data?.metadata?.next_cursor
         }
     }
 }
\ No newline at end of file
@@ -18,6 +18,7 @@ export interface MultipleResponseMetadata {
     current_page: number
     total_pages: number
     total_results: number
+    next_cursor?: string | null
 }
 
 export interface MultipleResponseData<T> extends ResponseData {
@@ -16,10 +16,21 @@ export interface DownloadResponseData extends ResponseData {
     start_time: string, // DateTime
     finish_time: string, // DateTime
     url: string,
+    priority: number,
     size_bytes: number,
     downloaded_bytes: number,
     content_type: string,
-    response_headers: string
+    response_headers: string,
+    rate_bytes: number | null,
+    eta_seconds: number | null
+}
+
+export interface DownloadProgressData {
+    id: number,
+    size_bytes: number,
+    downloaded_bytes: number,
+    rate_bytes: number,
+    eta_seconds: number | null
 }
 
 export interface DownloadsGetFilters {
@@ -28,7 +39,8 @@ export interface DownloadsGetFilters {
     obj_id?: number | number[],
     status?: number | number[],
     limit?: number,
-    page?: number
+    page?: number,
+    cursor?: string | null
 }
 
 export interface DownloadEnqueueParams {
@@ -36,6 +48,15 @@ export interface DownloadEnqueueParams {
     obj_id: number
 }
 
+export interface DownloadIdParams {
+    id: number
+}
+
+export interface DownloadReprioritizeParams {
+    id: number,
+    priority: number
+}
+
 export default class DownloadsAPI {
     public static get(filters: DownloadsGetFilters) {
         return axios.post<MultipleResponseData<DownloadResponseData>>(`/api/downloads/get`, filters);
@@ -48,4 +69,24 @@ export default class DownloadsAPI {
     public static enqueue(params: DownloadEnqueueParams) {
         return axios.post<DownloadResponseData>('/api/downloads/enqueue', params);
     }
+
+    public static progress() {
+        return axios.get<{results: DownloadProgressData[]}>('/api/downloads/progress');
+    }
+
+    public static pause(params: DownloadIdParams) {
+        return axios.post<DownloadResponseData>('/api/downloads/pause', params);
+    }
+
+    public static resume(params: DownloadIdParams) {
+        return axios.post<DownloadResponseData>('/api/downloads/resume', params);
+    }
+
+    public static cancel(params: DownloadIdParams) {
+        return axios.post<DownloadResponseData>('/api/downloads/cancel', params);
+    }
+
+    public static reprioritize(params: DownloadReprioritizeParams) {
+        return axios.post<DownloadResponseData>('/api/downloads/reprioritize', params);
+    }
 }
\ No newline at end of file
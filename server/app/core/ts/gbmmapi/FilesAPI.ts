@@ -10,6 +10,9 @@ export interface FileResponseData extends ResponseData {
     path: string
     size_bytes: number
     content_type: string
+    url: string
+    content_hash: string
+    hashed_mtime: number
 }
 
 export default class FilesAPI {
@@ -1,10 +1,20 @@
+import base64
+import json
+import math
+from datetime import datetime
+from typing import Optional
+
 from flask import Blueprint, redirect, url_for
-from sqlalchemy import select, or_, asc
+from sqlalchemy import select, or_, and_, asc, func, tuple_
+from sqlalchemy.sql import Select
 from config import config
-from server.database import Session, Download, Video, from_api
+from server.database import Session, Download, DownloadCount, Video, from_api
+from server.db_writer import db_writer
 from server.app.flask_helpers import bad_request, json_data, FilterHelper, dump, ListResultMetadata, api_key_required
 from server.downloader import downloader
 from server.gb_api import GBAPI
+from server.progress import progress_tracker
+from server.requester import RequestPriority
 from server.serialization import DownloadSchema
 
 bp = Blueprint('downloads', config.SERVER_NAME, url_prefix='/api/downloads')
@@ -31,6 +41,53 @@ class DownloadRequestData:
             raise ValueError(f'Unsupported object type "{self.object_type}"')
 
 
+class DownloadIdData:
+    def __init__(self):
+        json = json_data(required=True)
+
+        try:
+            self.id = int(json.get('id'))
+        except (ValueError, TypeError):
+            raise ValueError(f'Invalid download ID {json.get("id")}')
+
+
+def encode_cursor(download: Download) -> str:
+    """Returns an opaque cursor that continues a listing after the download."""
+    finish_time = download.finish_time.isoformat() if download.finish_time is not None else None
+    return base64.urlsafe_b64encode(json.dumps([finish_time, download.id]).encode()).decode()
+
+
+def decode_cursor(cursor: str) -> tuple[Optional[datetime], int]:
+    try:
+        finish_time, download_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return datetime.fromisoformat(finish_time) if finish_time is not None else None, int(download_id)
+    except (ValueError, TypeError, AttributeError):
+        raise ValueError(f'Invalid cursor {cursor}')
+
+
+def after_cursor(session, query: Select, cursor: str, limit: int) -> list[Download]:
+    """
+    Returns the downloads of a query that come after a cursor, in order of finish time and then ID, both descending.
+    Downloads that have not finished come last. Each part is read as a range of the finish time index, so a page costs
+    the same wherever it is in the listing.
+    """
+    finish_time, download_id = decode_cursor(cursor)
+    results = []
+    if finish_time is not None:
+        results = session.execute(
+            query
+            .filter(tuple_(Download.finish_time, Download.id) < (finish_time, download_id))
+            .limit(limit)
+        ).scalars().all()
+        download_id = None
+    if len(results) < limit:
+        unfinished = query.filter(Download.finish_time.is_(None))
+        if download_id is not None:
+            unfinished = unfinished.filter(Download.id < download_id)
+        results += session.execute(unfinished.limit(limit - len(results))).scalars().all()
+    return results
+
+
 def filter_downloads(session):
     """
     Expected data members:
@@ -40,7 +97,9 @@ def filter_downloads(session):
     status: int or list[int]
     limit: int
     page: int
-    :return: List of Downloads as JSON
+    cursor: str. Continues from the next_cursor of a previous result instead of skipping to the page. page is still
+    used as the current page number of the result.
+    :return: List of Downloads and the result metadata
     """
     json = json_data(required=True)
 
@@ -56,6 +115,7 @@ def filter_downloads(session):
             offset = json['page'] * limit - limit
 
     filters = FilterHelper()
+    statuses = None
     if 'id' in json:
         filters.eq_or_in(Download.id, json['id'])
     if 'obj_item_name' in json:
@@ -63,19 +123,33 @@ def filter_downloads(session):
     if 'obj_id' in json:
         filters.eq_or_in(Download.obj_id, json['obj_id'])
     if 'status' in json:
-        filters.eq_or_in(Download.status, json['status'])
-
-    count = session.query(Download).filter(filters.to_and()).count()
-    total_pages = int(count / limit)
+        statuses = json['status'] if isinstance(json['status'], list) else [json['status']]
+        # Finished downloads are most of the table, so the history is listed faster in the order of the finish time
+        # index than through the status index. Adding 0 keeps sqlite from choosing the status index.
+        finished = all(status in Download.finished_statuses for status in statuses)
+        filters.eq_or_in(Download.status + 0 if finished else Download.status, statuses)
+
+    # Listings by status are counted from the download counts. Other filters select few enough downloads to count.
+    if all(key in ('status', 'limit', 'page', 'cursor') for key in json.keys()):
+        count = DownloadCount.total(session, statuses)
+    else:
+        count = session.query(Download).filter(filters.to_and()).count()
+    total_pages = math.ceil(count / limit)
 
-    results = session.execute(
+    query = (
         select(Download)
         .filter(filters.to_and())
-        .order_by(Download.finish_time.desc())
-        .slice(offset, offset + limit)
-    ).scalars()
-    metadata = ListResultMetadata(limit, offset, page, total_pages, count)
-    return results, metadata
+        .order_by(Download.finish_time.desc(), Download.id.desc())
+    )
+    # One more than the limit, to know whether there is a next page
+    if json.get('cursor') is not None:
+        results = after_cursor(session, query, json['cursor'], limit + 1)
+        offset = None
+    else:
+        results = session.execute(query.offset(offset).limit(limit + 1)).scalars().all()
+    next_cursor = encode_cursor(results[limit - 1]) if len(results) > limit else None
+    metadata = ListResultMetadata(limit, offset, page, total_pages, count, next_cursor)
+    return results[:limit], metadata
 
 
 @bp.route('/get', methods=('POST',))
@@ -84,7 +158,7 @@ def get():
     try:
         with Session.begin() as session:
             results, metadata = filter_downloads(session)
-            return dump(results.all(), metadata)
+            return dump(results, metadata)
 
     except ValueError as e:
         return bad_request(exception=e)
@@ -96,52 +170,185 @@ def get_one():
     try:
         with Session.begin() as session:
             results, metadata = filter_downloads(session)
-            return dump(results.first())
+            return dump(results[0] if len(results) > 0 else None)
 
     except ValueError as e:
         return bad_request(exception=e)
 
 
+def download_overlay(session, objects: list[tuple[str, int]]) -> dict[tuple[str, int], Download]:
+    """
+    Looks up the latest download of each object in one query, for list endpoints that show the download status of
+    their objects. The latest download is the one that finished last. Downloads that have not finished come after
+    finished ones. The ranking reads only the obj_item_name, obj_id and finish_time index.
+    :param session: A SQLAlchemy session.
+    :param objects: A list of 2-value tuples. Tuple index 0 represents the obj_item_name. Tuple index 1 represents the
+    object ID.
+    :return: The latest download of each object that has one, by (obj_item_name, obj_id).
+    """
+    ids_by_item_name: dict[str, set[int]] = {}
+    for obj_item_name, obj_id in objects:
+        ids_by_item_name.setdefault(obj_item_name, set()).add(obj_id)
+    if len(ids_by_item_name) == 0:
+        return {}
+
+    ranked = (
+        select(
+            Download.id,
+            func.row_number().over(
+                partition_by=(Download.obj_item_name, Download.obj_id),
+                order_by=(Download.finish_time.desc(), Download.id.desc())
+            ).label('rank')
+        )
+        .where(or_(*[
+            and_(Download.obj_item_name == obj_item_name, Download.obj_id.in_(obj_ids))
+            for obj_item_name, obj_ids in ids_by_item_name.items()
+        ]))
+        .subquery()
+    )
+    latest = session.execute(
+        select(Download)
+        .join(ranked, Download.id == ranked.c.id)
+        .where(ranked.c.rank == 1)
+    ).scalars()
+    return {(d.obj_item_name, d.obj_id): d for d in latest}
+
+
 def get_for_objects(session, objects: list[tuple[str, int]]) -> list[Download]:
     """
     :param session: A SQLAlchemy session.
     :param objects: A list of 2-value tuples. Tuple index 0 represents the obj_item_name. Tuple index 1 represents the
     object ID.
-    :return: A list of downloads for the given objects.
+    :return: A list of the latest downloads for the given objects, in the order of the objects.
     """
-    downloads = []
-    for obj in objects:
-        download = session.execute(
-            select(Download)
-            .filter_by(obj_item_name=obj[0], obj_id=obj[1])
-            .order_by(Download.finish_time.desc())
-        ).scalars().first()
-        if download is not None:
-            downloads.append(download)
-    return downloads
+    overlay = download_overlay(session, objects)
+    return [overlay[obj] for obj in objects if obj in overlay]
 
 
 @bp.route('/enqueue', methods=('POST',))
 @api_key_required
 def enqueue():
     try:
-        with Session.begin() as session:
-            # noinspection PyTypeChecker
-            data = DownloadRequestData()
-            # TODO accept more than videos?
-            video = session.get(Video, data.id)
-            if video is None:
-                video_data = GBAPI.get_one('video', data.id)
+        # noinspection PyTypeChecker
+        data = DownloadRequestData()
+        # TODO accept more than videos?
+        with Session() as session:
+            video_data = None
+            if session.get(Video, data.id) is None:
+                # Fetched before the write so the API request does not hold up other writes
+                video_data = GBAPI.get_one('video', data.id, RequestPriority.ENQUEUE)
                 if video_data is None:
                     raise ValueError()
-                else:
-                    video = from_api(session, Video, video_data)
 
-            video_download = download_video_with_images(session, video)
-            session.add(video_download)
+        def enqueue_video(write_session):
+            if video_data is None:
+                video = write_session.get(Video, data.id)
+            else:
+                video = from_api(write_session, Video, video_data)
+
+            video_download = download_video_with_images(write_session, video)
+            write_session.add(video_download)
 
             return DownloadSchema().dump(video_download)
 
+        return db_writer.write(enqueue_video)
+
+    except ValueError as e:
+        return bad_request(exception=e)
+
+
+@bp.route('/progress', methods=('GET',))
+@api_key_required
+def progress():
+    """Live progress of every running download, read from memory."""
+    return {'results': progress_tracker.dump()}
+
+
+@bp.route('/pause', methods=('POST',))
+@api_key_required
+def pause():
+    try:
+        data = DownloadIdData()
+
+        def pause_download(write_session):
+            download = write_session.get(Download, data.id)
+            if download is None:
+                raise ValueError(f'No download with ID {data.id}')
+            if not downloader.pause(write_session, download):
+                raise ValueError(f'Download {data.id} is not queued or in progress.')
+
+            return DownloadSchema().dump(download)
+
+        return db_writer.write(pause_download)
+
+    except ValueError as e:
+        return bad_request(exception=e)
+
+
+@bp.route('/resume', methods=('POST',))
+@api_key_required
+def resume():
+    try:
+        data = DownloadIdData()
+
+        def resume_download(write_session):
+            download = write_session.get(Download, data.id)
+            if download is None:
+                raise ValueError(f'No download with ID {data.id}')
+            if not downloader.resume(write_session, download):
+                raise ValueError(f'Download {data.id} is not paused.')
+
+            return DownloadSchema().dump(download)
+
+        return db_writer.write(resume_download)
+
+    except ValueError as e:
+        return bad_request(exception=e)
+
+
+@bp.route('/cancel', methods=('POST',))
+@api_key_required
+def cancel():
+    try:
+        data = DownloadIdData()
+
+        def cancel_download(write_session):
+            download = write_session.get(Download, data.id)
+            if download is None:
+                raise ValueError(f'No download with ID {data.id}')
+            if not downloader.cancel(write_session, download):
+                raise ValueError(f'Download {data.id} has already finished.')
+
+            return DownloadSchema().dump(download)
+
+        return db_writer.write(cancel_download)
+
+    except ValueError as e:
+        return bad_request(exception=e)
+
+
+@bp.route('/reprioritize', methods=('POST',))
+@api_key_required
+def reprioritize():
+    try:
+        data = DownloadIdData()
+        json = json_data(required=True)
+        try:
+            priority = int(json.get('priority'))
+        except (ValueError, TypeError):
+            raise ValueError(f'Invalid priority {json.get("priority")}')
+
+        def reprioritize_download(write_session):
+            download = write_session.get(Download, data.id)
+            if download is None:
+                raise ValueError(f'No download with ID {data.id}')
+            if not downloader.reprioritize(write_session, download, priority):
+                raise ValueError(f'Download {data.id} is not queued or paused.')
+
+            return DownloadSchema().dump(download)
+
+        return db_writer.write(reprioritize_download)
+
     except ValueError as e:
         return bad_request(exception=e)
 
@@ -0,0 +1,29 @@
+from flask import Blueprint
+
+from config import config
+from server.app.flask_helpers import bad_request, json_data, api_key_required
+from server.file_verifier import file_verifier
+
+bp = Blueprint('files', config.SERVER_NAME, url_prefix='/api/files')
+
+
+@bp.route('/verify', methods=('GET',))
+@api_key_required
+def verify_status():
+    """Whether a verify pass is running, and the report of the last pass."""
+    return file_verifier.dump()
+
+
+@bp.route('/verify', methods=('POST',))
+@api_key_required
+def verify():
+    """
+    Starts verifying the library in the background.
+    Expected data members:
+    full: bool, optional. Hash every file, including files that have not changed since they were last hashed.
+    """
+    json = json_data()
+    full = bool(json.get('full', False)) if json is not None else False
+    if not file_verifier.start(full):
+        return bad_request('Files are already being verified.')
+    return file_verifier.dump()
@@ -85,12 +85,15 @@ class FilterHelper:
 
 
 class ListResultMetadata:
-    def __init__(self, limit: int, offset: int, current_page: int, total_pages: int, total_results: int):
+    def __init__(self, limit: int, offset: int, current_page: int, total_pages: int, total_results: int,
+                 next_cursor: str = None):
         self.limit = limit
         self.offset = offset
         self.current_page = current_page
         self.total_pages = total_pages
         self.total_results = total_results
+        self.next_cursor = next_cursor
+        '''Continues the listing after this page, for listings that support cursors. None on the last page.'''
 
     def dump(self):
         return {
@@ -98,7 +101,8 @@ class ListResultMetadata:
             'limit': self.limit,
             'current_page': self.current_page,
             'total_pages': self.total_pages,
-            'total_results': self.total_results
+            'total_results': self.total_results,
+            'next_cursor': self.next_cursor
         }
 
 
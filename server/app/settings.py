@@ -4,6 +4,7 @@ from sqlalchemy import select
 from server.app.flask_helpers import ok, json_data, api_key_required
 from config import config
 from server.database import Session, Setting
+from server.downloader import downloader
 
 bp = Blueprint('settings', config.SERVER_NAME, url_prefix='/api/settings')
 
@@ -38,6 +39,10 @@ def modify():
         config.modify(setting['address'], setting['value'])
         value = config.get(setting['address']).value
         out[setting['address']] = value
+        if setting['address'] == 'downloads.workers':
+            downloader.resize(value)
+        elif setting['address'] == 'downloads.scheduler':
+            downloader.set_scheduler(value)
     return out
 
 
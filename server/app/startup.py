@@ -2,16 +2,16 @@ from flask import Blueprint
 from config import config
 from . import video_shows, video_categories
 from server.app.flask_helpers import ok, is_ok, unavailable
-from ..database import Session, Setting
+from ..database import Setting
+from ..db_writer import db_writer
 
 bp = Blueprint('startup', config.SERVER_NAME, url_prefix='/api/startup')
 
 
 @bp.route('/run', methods=('POST',))
 def run():
-    with Session.begin() as session:
-        Setting.set(session, 'startup_initiated', 'True')
-        shows_result = video_shows.refresh_shows(session)
-        categories_result = video_categories.refresh_categories(session)
-        Setting.set(session, 'startup_complete', 'True')
-        return ok()
+    db_writer.write(lambda session: Setting.set(session, 'startup_initiated', 'True'))
+    video_shows.refresh_shows()
+    video_categories.refresh_categories()
+    db_writer.write(lambda session: Setting.set(session, 'startup_complete', 'True'))
+    return ok()
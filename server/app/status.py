@@ -0,0 +1,39 @@
+from flask import Blueprint
+
+from config import config
+from server.database import engine, operational_engine, catalog_database, operational_database
+from server.db_writer import db_writer
+from server.downloader import downloader
+from server.http_pool import http_pool
+from server.requester import requester
+from server.sqlite_pragmas import active_pragmas
+
+bp = Blueprint('status', config.SERVER_NAME, url_prefix='/api/status')
+
+
+@bp.route('/requester', methods=('GET',))
+def requester_status():
+    return requester.dump()
+
+
+@bp.route('/http', methods=('GET',))
+def http_status():
+    return http_pool.dump()
+
+
+@bp.route('/downloader', methods=('GET',))
+def downloader_status():
+    return downloader.dump()
+
+
+@bp.route('/database', methods=('GET',))
+def database_status():
+    return {
+        catalog_database: active_pragmas(engine),
+        operational_database: active_pragmas(operational_engine)
+    }
+
+
+@bp.route('/db-writer', methods=('GET',))
+def db_writer_status():
+    return db_writer.dump()
@@ -3,29 +3,33 @@ from sqlalchemy import select
 
 from server.app.flask_helpers import dump, ok, api_key_required
 from server.gb_api import GBAPI
+from server.requester import RequestPriority
 from server.database import Session, from_api, VideoCategory
+from server.db_writer import db_writer
 from config import config
 
 bp = Blueprint('video_categories', config.SERVER_NAME, url_prefix='/api/video-categories')
 
 
-def refresh_categories(session):
-    s = GBAPI.select('video_category')
+def refresh_categories():
+    s = GBAPI.select('video_category').priority(RequestPriority.BACKGROUND)
     categories_results = s.next()
     while not s.is_last_page:
         categories_results += s.next()
 
-    categories = from_api(session, VideoCategory, categories_results)
-    for category in categories:
-        session.add(category)
+    def store_categories(session):
+        categories = from_api(session, VideoCategory, categories_results)
+        for category in categories:
+            session.add(category)
+
+    db_writer.write(store_categories)
 
 
 @bp.route('/refresh-all', methods=('GET',))
 @api_key_required
 def refresh_all():
-    with Session.begin() as session:
-        refresh_categories(session)
-        return ok()
+    refresh_categories()
+    return ok()
 
 
 @bp.route('/get-all', methods=('GET',))
@@ -3,29 +3,33 @@ from sqlalchemy import select
 
 from server.app.flask_helpers import dump, ok, api_key_required
 from server.gb_api import GBAPI
+from server.requester import RequestPriority
 from server.database import Session, from_api, VideoShow
+from server.db_writer import db_writer
 from config import config
 
 bp = Blueprint('video_shows', config.SERVER_NAME, url_prefix='/api/video-shows')
 
 
-def refresh_shows(session):
-    s = GBAPI.select('video_show')
+def refresh_shows():
+    s = GBAPI.select('video_show').priority(RequestPriority.BACKGROUND)
     show_results = s.next()
     while not s.is_last_page:
         show_results += s.next()
 
-    shows = from_api(session, VideoShow, show_results)
-    for show in shows:
-        session.add(show)
+    def store_shows(session):
+        shows = from_api(session, VideoShow, show_results)
+        for show in shows:
+            session.add(show)
+
+    db_writer.write(store_shows)
 
 
 @bp.route('/refresh-all', methods=('GET',))
 @api_key_required
 def refresh_all():
-    with Session.begin() as session:
-        refresh_shows(session)
-        return ok()
+    refresh_shows()
+    return ok()
 
 
 @bp.route('/get-all', methods=('GET',))
@@ -1,9 +1,11 @@
 import flask
 from flask import Blueprint
+from sqlalchemy import select
 
 from server.app.flask_helpers import json_data, bad_request, dump, FilterHelper, api_key_required
 from server.gb_api import GBAPI, SortDirection
 from server.database import Session, Video, from_api
+from server.db_writer import db_writer
 from . import downloads
 from config import config
 
@@ -92,8 +94,11 @@ def browse():
     page = videos_select.page(page)
     flask.session['videos_browse_metadata'] = videos_select.to_session_data()
 
-    with Session.begin() as session:
-        videos = from_api(session, Video, page)
+    video_ids = db_writer.write(lambda write_session: [v.id for v in from_api(write_session, Video, page)])
+
+    with Session() as session:
+        videos_by_id = {v.id: v for v in session.execute(select(Video).where(Video.id.in_(video_ids))).scalars()}
+        videos = [videos_by_id[video_id] for video_id in video_ids if video_id in videos_by_id]
 
         video_tuples = [('video', v.id) for v in videos]
         downloads_list = downloads.get_for_objects(session, video_tuples)
@@ -118,8 +123,7 @@ def get():
 
     videos = s.next()
 
-    with Session.begin() as session:
-        return dump(from_api(session, Video, videos))
+    return db_writer.write(lambda session: dump(from_api(session, Video, videos)))
 
 
 @bp.route('/get-one', methods=('POST',))
@@ -138,5 +142,4 @@ def get_one():
     if video is None:
         raise ValueError('Bad JSON.')
 
-    with Session.begin() as session:
-        return dump(from_api(session, Video, video))
+    return db_writer.write(lambda session: dump(from_api(session, Video, video)))
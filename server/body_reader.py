@@ -0,0 +1,115 @@
+import errno
+import http.client
+import os
+import time
+from typing import Iterator
+
+import requests
+
+
+class BodyReader:
+    """
+    Reads the body of a streamed response into one reusable buffer, so a download does not allocate a new bytes object
+    for every chunk. Each chunk is a view of the buffer and is only valid until the next chunk is read.
+
+    The chunk size adapts to the measured throughput. It grows while chunks fill quickly and shrinks when they are
+    slow, so each chunk takes about ``target_seconds`` and a slow download still notices a pause request promptly.
+    """
+    min_chunk_size = 256 * 1024  # 256 KB
+    target_seconds = 0.5
+    '''How long reading one chunk should take.'''
+
+    def __init__(self, response: requests.Response, max_chunk_size: int, chunk_size: int = 1024 * 1024):
+        self.max_chunk_size = max(max_chunk_size, BodyReader.min_chunk_size)
+        self.chunk_size = min(max(chunk_size, BodyReader.min_chunk_size), self.max_chunk_size)
+        self.__buffer = bytearray(self.max_chunk_size)
+        '''Sized for the largest chunk up front, so growing the chunk size never allocates.'''
+        self.__raw = response.raw
+        self.__read_into = BodyReader.__reader(response)
+
+    @staticmethod
+    def __reader(response: requests.Response):
+        """
+        Returns a function that reads into a buffer and returns the number of bytes read. When the body is not
+        compressed the bytes are read straight from the connection into the buffer. Compressed bodies have to be
+        decoded by urllib3, which returns new objects that are then copied into the buffer, and which returns the
+        connection to the pool itself once the body has been read.
+        """
+        raw = response.raw
+        encoding = response.headers.get('Content-Encoding', 'identity').lower()
+        connection = getattr(raw, '_fp', None)
+        if encoding == 'identity' and connection is not None and hasattr(connection, 'readinto'):
+            return connection.readinto
+
+        def read_decoded(view: memoryview) -> int:
+            data = raw.read(len(view), decode_content=True)
+            view[:len(data)] = data
+            return len(data)
+        return read_decoded
+
+    def __fill(self, view: memoryview) -> int:
+        """
+        Reads until the view is full or the body ends. A body that ends before its Content-Length also just ends here,
+        so the downloader can see that it was truncated and resume it.
+        """
+        filled = 0
+        while filled < len(view):
+            try:
+                read = self.__read_into(view[filled:])
+            except http.client.IncompleteRead:
+                break
+            if not read:
+                break
+            filled += read
+        return filled
+
+    def __release(self):
+        """
+        Returns the connection to the pool once the whole body has been read straight from it, as urllib3 does when it
+        reads the body itself. Otherwise closing the response would close the connection and the next request to the
+        host would open a new one. A body that ended before its Content-Length leaves the connection to be closed.
+        """
+        connection = getattr(self.__raw, '_fp', None)
+        if connection is None or not hasattr(connection, 'isclosed'):
+            return
+        if connection.isclosed() and not connection.length:
+            self.__raw.release_conn()
+
+    def __adapt(self, elapsed: float):
+        if elapsed < BodyReader.target_seconds / 2 and self.chunk_size < self.max_chunk_size:
+            self.chunk_size = min(self.chunk_size * 2, self.max_chunk_size)
+        elif elapsed > BodyReader.target_seconds * 2 and self.chunk_size > BodyReader.min_chunk_size:
+            self.chunk_size = max(self.chunk_size // 2, BodyReader.min_chunk_size)
+
+    def chunks(self) -> Iterator[memoryview]:
+        """Yields the body in chunks. Each chunk must be written out before the next one is requested."""
+        buffer = memoryview(self.__buffer)
+        while True:
+            start = time.monotonic()
+            view = buffer[:self.chunk_size]
+            filled = self.__fill(view)
+            if filled == 0:
+                self.__release()
+                return
+            yield view[:filled]
+            self.__adapt(time.monotonic() - start)
+
+
+def preallocate(handle, size_bytes: int):
+    """
+    Reserves space for a file of the given size, so the filesystem can lay it out in one piece and a full disk is
+    reported before the download starts. Only the file length is set on systems without ``posix_fallocate``.
+    """
+    if not size_bytes:
+        return
+    try:
+        os.posix_fallocate(handle.fileno(), 0, size_bytes)
+        return
+    except AttributeError:
+        pass
+    except OSError as e:
+        # Not every filesystem supports it, but a full disk should fail the download now
+        if e.errno == errno.ENOSPC:
+            raise
+    if os.fstat(handle.fileno()).st_size < size_bytes:
+        handle.truncate(size_bytes)
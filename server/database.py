@@ -1,5 +1,7 @@
 import os
 import json
+import hashlib
+import sqlite3
 from datetime import datetime
 from enum import IntEnum
 from pathlib import Path
@@ -7,12 +9,17 @@ from typing import Type, Callable
 
 from marshmallow import Schema
 from requests.structures import CaseInsensitiveDict
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, ForeignKey, select
-from sqlalchemy.orm import declarative_base, relationship, sessionmaker
+from sqlalchemy import create_engine, event, Column, Integer, String, DateTime, Float, ForeignKey, Index, Table, DDL, \
+    select, inspect, func
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import declarative_base, relationship, sessionmaker, RelationshipProperty, MANYTOONE
 
 from config import config
+from server import api_format
 from server.serialization import FileSchema, Marshmallowable, DownloadSchema, ImageSchema, VideoSchema, VideoShowSchema, \
     SettingSchema, VideoCategorySchema
+from server.sqlite_pragmas import apply_pragmas
 
 
 class DatabaseError(IOError):
@@ -36,11 +43,33 @@ class Base:
         return f'{self.__class__.__name__}({params})'
 
 
+def attach_database(engine: Engine, path: str, name: str):
+    """
+    Attaches another database file to every connection the engine opens, so queries can join tables of both files.
+    Unqualified table names that are not in the engine's own file resolve to the attached file.
+    """
+    @event.listens_for(engine, 'connect')
+    def attach(dbapi_connection, connection_record):
+        dbapi_connection.execute(f'ATTACH DATABASE ? AS {name}', (path,))
+
+
+catalog_database = 'catalog'
+'''Name of the database of the Giant Bomb catalog: videos, shows, categories and images.'''
+operational_database = 'operational'
+'''Name of the database of the download queue, download history, files and settings.'''
+
 db_path = os.path.join(config.DATABASE_DIR, config.DATABASE_NAME)
+operational_db_path = os.path.join(config.DATABASE_DIR, config.DATABASE_OPERATIONAL_NAME)
 # Create the database directory if it does not exist
 Path(db_path).parent.absolute().mkdir(parents=True, exist_ok=True)
-db_url = f'sqlite+pysqlite:///{db_path}'
-engine = create_engine(db_url, future=True)
+# Each file has its own pool, so downloads writing their progress never wait on the catalog's write lock. The other
+# file is attached for the queries that join across them. Attach first so the journal mode also applies to it.
+engine = create_engine(f'sqlite+pysqlite:///{db_path}', future=True)
+attach_database(engine, operational_db_path, operational_database)
+apply_pragmas(engine)
+operational_engine = create_engine(f'sqlite+pysqlite:///{operational_db_path}', future=True)
+attach_database(operational_engine, db_path, catalog_database)
+apply_pragmas(operational_engine)
 Session = sessionmaker(engine)
 Base = declarative_base(cls=Base)
 
@@ -70,12 +99,172 @@ class GBBase(Marshmallowable):
     def from_api_result(cls, session, result):
         pass
 
+    @classmethod
+    def bulk_from_api_results(cls, session, results: list) -> list:
+        pass
+
 
 class GBDownloadable:
     file_id: Column
     file: Column
 
 
+def _to_int(value):
+    try:
+        return int(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def _to_str(value):
+    if isinstance(value, bool):
+        # Keep the API's own spelling of booleans regardless of the response format
+        return 'true' if value else 'false'
+    return str(value)
+
+
+class MappingPlan:
+    """
+    Describes how the fields of an API result map onto the attributes of an entity class. Compiled once per class
+    so ingesting a result is a loop over precomputed attribute names and converters.
+    """
+    __plans: dict[type, 'MappingPlan'] = {}
+    max_variables = 32766 if sqlite3.sqlite_version_info >= (3, 32, 0) else 999
+    '''The maximum number of bound parameters SQLite accepts in one statement.'''
+
+    def __init__(self, entity_type: type):
+        mapper = inspect(entity_type)
+        self.entity_type = entity_type
+        self.primary_key: str = mapper.get_property_by_column(mapper.primary_key[0]).key
+        '''Attribute name of the primary key.'''
+        self.columns: list[tuple[str, Callable]] = []
+        '''Attribute name and value converter for each column.'''
+        self.relationships: list[tuple[str, type, str]] = []
+        '''
+        Attribute name, target entity class and attribute name of the foreign key column for each many-to-one
+        relationship.
+        '''
+
+        for attr in mapper.attrs:
+            if isinstance(attr, RelationshipProperty):
+                if attr.direction is MANYTOONE:
+                    fk_column = next(iter(attr.local_columns))
+                    fk_key = mapper.get_property_by_column(fk_column).key
+                    self.relationships.append((attr.key, attr.mapper.class_, fk_key))
+            else:
+                column_type = attr.columns[0].type
+                if isinstance(column_type, Integer):
+                    self.columns.append((attr.key, _to_int))
+                elif isinstance(column_type, String):
+                    self.columns.append((attr.key, _to_str))
+                else:
+                    self.columns.append((attr.key, lambda value: value))
+
+    @staticmethod
+    def of(entity_type: type) -> 'MappingPlan':
+        plan = MappingPlan.__plans.get(entity_type)
+        if plan is None:
+            plan = MappingPlan(entity_type)
+            MappingPlan.__plans[entity_type] = plan
+        return plan
+
+    def values(self, result) -> dict[str, any]:
+        """Returns the converted column values present in an API result."""
+        get = api_format.value_getter(result)
+        values = {}
+        for key, convert in self.columns:
+            val = get(key)
+            if val is not None:
+                values[key] = convert(val)
+        return values
+
+    def apply(self, session, result, obj) -> bool:
+        """
+        Sets the attributes of ``obj`` from an API result, ingesting related entities along the way.
+        :return: True if any attribute was set.
+        """
+        found = False
+        for key, val in self.values(result).items():
+            found = True
+            setattr(obj, key, val)
+
+        for key, target_entity_type, _ in self.relationships:
+            node = api_format.single(api_format.get_node(result, key))
+            if node is not None:
+                related = target_entity_type.from_api_result(session, node)
+                if related is not None:
+                    found = True
+                    setattr(obj, key, related)
+        return found
+
+    def bulk_values(self, session, results: list) -> list[dict[str, any]]:
+        """
+        Returns the converted column values of each API result. Related entities are ingested in bulk, one batch per
+        relationship, and referenced through their foreign key columns.
+        """
+        rows = [self.values(r) for r in results]
+        for key, target_entity_type, fk_key in self.relationships:
+            indexes = []
+            nodes = []
+            for i, result in enumerate(results):
+                node = api_format.single(api_format.get_node(result, key))
+                if node is not None:
+                    indexes.append(i)
+                    nodes.append(node)
+            if len(nodes) == 0:
+                continue
+
+            related = target_entity_type.bulk_from_api_results(session, nodes)
+            target_primary_key = MappingPlan.of(target_entity_type).primary_key
+            for i, obj in zip(indexes, related):
+                if obj is not None:
+                    rows[i][fk_key] = getattr(obj, target_primary_key)
+        return rows
+
+    @staticmethod
+    def existing_values(obj, keys) -> dict[str, any]:
+        """Returns an existing object's values for the given attributes."""
+        return {k: getattr(obj, k) for k in keys}
+
+    def select_in(self, session, column, values: list) -> list:
+        """Selects the entities whose ``column`` matches any of ``values``, in as few statements as possible."""
+        found = []
+        for i in range(0, len(values), MappingPlan.max_variables):
+            found += session.execute(
+                select(self.entity_type)
+                .where(column.in_(values[i:i + MappingPlan.max_variables]))
+                .execution_options(populate_existing=True)
+            ).scalars().all()
+        return found
+
+    def upsert(self, session, rows: list[dict[str, any]]):
+        """
+        Inserts or updates rows with INSERT ... ON CONFLICT DO UPDATE. Rows are grouped by the set of columns they
+        contain so only those columns are updated. Each group is written in one statement, split only when it would
+        exceed SQLite's limit on bound parameters.
+        """
+        table = self.entity_type.__table__
+        mapper = inspect(self.entity_type)
+        primary_key_column = mapper.primary_key[0]
+        groups: dict[tuple[str, ...], list[dict[str, any]]] = {}
+        for row in rows:
+            groups.setdefault(tuple(sorted(row.keys())), []).append(row)
+
+        for keys, group in groups.items():
+            column_names = {k: mapper.attrs[k].columns[0].key for k in keys}
+            per_statement = max(MappingPlan.max_variables // len(keys), 1)
+            for i in range(0, len(group), per_statement):
+                stmt = sqlite_insert(table).values([
+                    {column_names[k]: v for k, v in row.items()}
+                    for row in group[i:i + per_statement]
+                ])
+                stmt = stmt.on_conflict_do_update(
+                    index_elements=[primary_key_column],
+                    set_={c: stmt.excluded[c] for c in column_names.values() if c != primary_key_column.key}
+                )
+                session.execute(stmt)
+
+
 class GBEntity(GBBase):
     @classmethod
     def from_api_result(cls, session, result):
@@ -83,33 +272,48 @@ class GBEntity(GBBase):
         if existing is not None:
             return existing
 
-        empty = True
         new = cls()
-        keys = [attr.key for attr in new._sa_instance_state.attrs]
-        for key in keys:
-            if hasattr(result, key):
-                # Check if this is a mapped entity
-                if hasattr(getattr(cls, key).property, 'entity'):
-                    # Is a mapped entity
-                    target_entity_type = getattr(cls, key).property.entity.entity
-                    obj = target_entity_type.from_api_result(session, getattr(result, key))
-
-                    if obj is not None:
-                        empty = False
-                        setattr(new, key, obj)
-                else:
-                    # Is not a mapped entity
-                    val = getattr(result, key, None).pyval
-                    if val is not None:
-                        empty = False
-                        setattr(new, key, val)
-
-        if empty:
+        if not MappingPlan.of(cls).apply(session, result, new):
             return None
         else:
             new.last_full_refresh = datetime.now().isoformat()
             return new
 
+    @classmethod
+    def bulk_from_api_results(cls, session, results: list) -> list:
+        """
+        Ingests a list of API results. Existing rows are looked up with a single query, and new or changed rows are
+        written with one upsert per set of columns. Rows whose content is unchanged are not written.
+        :return: The entity for each result, in the same order. None for results without an ID or any values.
+        """
+        plan = MappingPlan.of(cls)
+        rows = plan.bulk_values(session, results)
+        primary_key = plan.primary_key
+        primary_key_column = getattr(cls, primary_key)
+
+        ids = list({row[primary_key] for row in rows if primary_key in row})
+        existing = {getattr(obj, primary_key): obj for obj in plan.select_in(session, primary_key_column, ids)}
+
+        now = datetime.now().isoformat()
+        changed: dict[any, dict[str, any]] = {}
+        for row in rows:
+            if primary_key not in row:
+                continue
+            obj = existing.get(row[primary_key])
+            if obj is not None and row == plan.existing_values(obj, row.keys()):
+                continue
+            # The same entity can appear more than once in a page. Merge its values into one row.
+            merged = changed.setdefault(row[primary_key], {})
+            merged.update(row)
+            merged['last_full_refresh'] = now
+
+        if len(changed) > 0:
+            plan.upsert(session, list(changed.values()))
+            for obj in plan.select_in(session, primary_key_column, list(changed.keys())):
+                existing[getattr(obj, primary_key)] = obj
+
+        return [existing.get(row[primary_key]) if primary_key in row else None for row in rows]
+
     @classmethod
     def get_existing(cls, session, *, obj: 'GBBase' = None, api_result: any = None):
         """
@@ -122,7 +326,7 @@ class GBEntity(GBBase):
         if obj is not None:
             obj_id = obj.id
         elif api_result is not None:
-            obj_id = int(getattr(api_result, 'id', -1))
+            obj_id = int(api_format.get_value(api_result, 'id', -1))
         else:
             return None
         return session.get(cls, obj_id)
@@ -134,6 +338,7 @@ class GBEntity(GBBase):
 
 class Setting(Base, Marshmallowable):
     __tablename__ = 'setting'
+    __database__ = operational_database
     __marshmallow_schema__ = SettingSchema
     id = Column(Integer, primary_key=True)
     key = Column(String)
@@ -159,7 +364,12 @@ class Setting(Base, Marshmallowable):
 
 class File(Base, Marshmallowable):
     __tablename__ = 'file'
+    __database__ = operational_database
     __marshmallow_schema__ = FileSchema
+    __table_args__ = (
+        Index('ix_file_url', 'url'),
+        Index('ix_file_content_hash', 'content_hash')
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String)
     obj_item_name = Column(String)
@@ -169,6 +379,15 @@ class File(Base, Marshmallowable):
     path = Column(String)
     size_bytes = Column(Integer)
     content_type = Column(String)
+    url = Column(String)
+    '''The URL the file was downloaded from, used to find content that is already stored.'''
+    content_hash = Column(String)
+    '''SHA-256 of the content. The file is a link to the blob of this hash in the file store.'''
+    hashed_mtime = Column(Float)
+    '''
+    Modification time of the file when content_hash was computed. Files whose size and modification time have not
+    changed since are not hashed again when the library is verified.
+    '''
 
     @staticmethod
     def __get_url_file_part(url: str):
@@ -197,13 +416,20 @@ class File(Base, Marshmallowable):
             obj_url_field=download.obj_url_field,
             path=File.__build_destination_path(download),
             size_bytes=download.size_bytes,
-            content_type=download.content_type
+            content_type=download.content_type,
+            url=download.url
         )
 
 
 class Download(Base, Marshmallowable):
     __tablename__ = 'download'
+    __database__ = operational_database
     __marshmallow_schema__ = DownloadSchema
+    __table_args__ = (
+        Index('ix_download_status_created_time', 'status', 'created_time'),
+        Index('ix_download_obj_finish_time', 'obj_item_name', 'obj_id', 'finish_time'),
+        Index('ix_download_finish_time', 'finish_time')
+    )
     id = Column(Integer, primary_key=True)
     name = Column(String)
     obj_item_name = Column(String)
@@ -217,6 +443,8 @@ class Download(Base, Marshmallowable):
     start_time = Column(DateTime)
     finish_time = Column(DateTime)
     url = Column(String)
+    priority = Column(Integer, default=0)
+    '''Queued downloads with a lower priority are started first.'''
     _size_bytes = Column('size_bytes', Integer)
     '''Size of the downloadable data in bytes. Set when response_headers is set.'''
     downloaded_bytes = Column(Integer)
@@ -224,6 +452,11 @@ class Download(Base, Marshmallowable):
     '''Content MIME type. Set when response_headers is set.'''
     _response_headers = Column('response_headers', String)
     '''Full set of headers returned with the download request as serialized JSON.'''
+    segments = Column(String)
+    '''
+    Byte ranges of a segmented download and how many bytes of each have been written, as serialized JSON. None if the
+    download is fetched in a single stream.
+    '''
 
     class DownloadStatus(IntEnum):
         QUEUED = 10
@@ -233,6 +466,9 @@ class Download(Base, Marshmallowable):
         CANCELLED = 50
         FAILED = 90
 
+    finished_statuses = (DownloadStatus.COMPLETE, DownloadStatus.CANCELLED, DownloadStatus.FAILED)
+    '''Statuses of downloads in the download history.'''
+
     @staticmethod
     def create_from_obj(obj: GBEntity, obj_url_field: str):
         return Download(
@@ -242,6 +478,7 @@ class Download(Base, Marshmallowable):
             obj_url_field=obj_url_field,
             url=getattr(obj, obj_url_field),
             created_time=datetime.now(),
+            priority=0,
             downloaded_bytes=0
         )
 
@@ -265,7 +502,57 @@ class Download(Base, Marshmallowable):
         """Full set of headers returned with the download request as serialized JSON."""
         self._response_headers = json.dumps(dict(value))
         self._content_type = str(value.get('Content-Type'))
-        self._size_bytes = int(value.get('Content-Length', 0))
+        # The Content-Length of a partial response only covers the requested range. Take the full size from the range.
+        content_range = value.get('Content-Range')
+        if content_range is not None and not content_range.endswith('/*'):
+            self._size_bytes = int(content_range.rsplit('/', 1)[-1])
+        else:
+            self._size_bytes = int(value.get('Content-Length', 0))
+
+
+class DownloadCount(Base):
+    """
+    Number of downloads with each status. Kept up to date by triggers on the download table, so listings can count
+    the download history without scanning it.
+    """
+    __tablename__ = 'download_count'
+    __database__ = operational_database
+    status = Column(Integer, primary_key=True, autoincrement=False)
+    count = Column(Integer, nullable=False, default=0)
+
+    @staticmethod
+    def total(session, statuses: list[int] = None) -> int:
+        """
+        :param statuses: Download statuses to count. None counts every download.
+        :return: The number of downloads with any of the statuses.
+        """
+        query = select(func.coalesce(func.sum(DownloadCount.count), 0))
+        if statuses is not None:
+            query = query.where(DownloadCount.status.in_(statuses))
+        return session.execute(query).scalar()
+
+    @staticmethod
+    def triggers(schema: str = 'main') -> list[str]:
+        """Returns the statements that create the triggers counting downloads in the given database."""
+        def change(status: str, delta: str) -> str:
+            return (
+                f'INSERT OR IGNORE INTO download_count (status, count) SELECT {status}, 0 WHERE {status} IS NOT NULL; '
+                f'UPDATE download_count SET count = count {delta} 1 WHERE status = {status}; '
+            )
+
+        return [
+            f'CREATE TRIGGER IF NOT EXISTS {schema}.download_count_insert AFTER INSERT ON download '
+            f'BEGIN {change("NEW.status", "+")}END',
+            f'CREATE TRIGGER IF NOT EXISTS {schema}.download_count_delete AFTER DELETE ON download '
+            f'BEGIN {change("OLD.status", "-")}END',
+            f'CREATE TRIGGER IF NOT EXISTS {schema}.download_count_update AFTER UPDATE OF status ON download '
+            f'WHEN OLD.status IS NOT NEW.status '
+            f'BEGIN {change("OLD.status", "-")}{change("NEW.status", "+")}END'
+        ]
+
+
+for statement in DownloadCount.triggers():
+    event.listen(Download.__table__, 'after_create', DDL(statement))
 
 
 class Association(Base, GBEntity):
@@ -321,6 +608,28 @@ class Image(Base, GBBase, GBDownloadable):
     file_id = Column(Integer, ForeignKey('file.id'))
     file = relationship('File')
     last_full_refresh = Column(String)
+    url_hash = Column(String, index=True, unique=True)
+    '''Hash of the normalized set of URLs of the image, which together identify it. See Image.compute_url_hash.'''
+
+    url_fields = ['icon_url', 'medium_url', 'original_url', 'screen_url', 'screen_large_url', 'small_url', 'super_url',
+                  'thumb_url', 'tiny_url']
+    '''The fields that together identify an image.'''
+
+    @classmethod
+    def compute_url_hash(cls, values) -> str:
+        """Returns the hash identifying an image from its URLs. Accepts an Image, an API result or a dict of values."""
+        if isinstance(values, dict):
+            get = values.get
+        elif isinstance(values, Image):
+            def get(f: str):
+                return getattr(values, f)
+        else:
+            get = api_format.value_getter(values)
+        urls = []
+        for f in cls.url_fields:
+            url = get(f)
+            urls.append('' if url is None else str(url).strip())
+        return hashlib.sha1('\n'.join(urls).encode('utf-8')).hexdigest()
 
     @classmethod
     def from_api_result(cls, session, result):
@@ -328,22 +637,55 @@ class Image(Base, GBBase, GBDownloadable):
         if existing is not None:
             return existing
 
-        empty = True
         new = cls()
-        keys = [attr.key for attr in new._sa_instance_state.attrs]
-        for key in keys:
-            if hasattr(result, key):
-                val = getattr(result, key, None).pyval
-                if val is not None:
-                    empty = False
-                    setattr(new, key, val)
-
-        if empty:
+        if not MappingPlan.of(cls).apply(session, result, new):
             return None
         else:
+            new.url_hash = cls.compute_url_hash(new)
             new.last_full_refresh = datetime.now().isoformat()
             return new
 
+    @classmethod
+    def bulk_from_api_results(cls, session, results: list) -> list:
+        """
+        Ingests a list of API image results. Existing images are looked up by URL hash with a single query and new
+        images are inserted in bulk. Images are never updated, since their URLs are their identity.
+        :return: The Image for each result, in the same order. None for results without any values.
+        """
+        plan = MappingPlan.of(cls)
+        rows = plan.bulk_values(session, results)
+        for row in rows:
+            if len(row) > 0:
+                row['url_hash'] = cls.compute_url_hash(row)
+
+        hashes = list({row['url_hash'] for row in rows if len(row) > 0})
+        images = {image.url_hash: image for image in plan.select_in(session, cls.url_hash, hashes)}
+
+        now = datetime.now().isoformat()
+        new_rows = {}
+        for row in rows:
+            if len(row) > 0 and row['url_hash'] not in images:
+                new_rows[row['url_hash']] = dict(row, last_full_refresh=now)
+
+        if len(new_rows) > 0:
+            # Rows sharing a column set are inserted together. Another thread may have inserted the same image in the
+            # meantime, in which case the existing row is kept.
+            groups: dict[tuple[str, ...], list[dict[str, any]]] = {}
+            for row in new_rows.values():
+                groups.setdefault(tuple(sorted(row.keys())), []).append(row)
+            for keys, group in groups.items():
+                per_statement = max(MappingPlan.max_variables // len(keys), 1)
+                for i in range(0, len(group), per_statement):
+                    session.execute(
+                        sqlite_insert(cls.__table__)
+                        .values(group[i:i + per_statement])
+                        .on_conflict_do_nothing(index_elements=[cls.url_hash])
+                    )
+            for image in plan.select_in(session, cls.url_hash, list(new_rows.keys())):
+                images[image.url_hash] = image
+
+        return [images.get(row['url_hash']) if len(row) > 0 else None for row in rows]
+
     @classmethod
     def get_existing(cls, session, *, image: 'Image' = None, api_result: any = None):
         """
@@ -354,33 +696,14 @@ class Image(Base, GBBase, GBDownloadable):
         :return: The existing object, or None if no matching object exists.
         """
         if image is not None:
-            return session.execute(
-                select(cls).filter_by(
-                    icon_url=image.icon_url,
-                    medium_url=image.medium_url,
-                    original_url=image.original_url,
-                    screen_url=image.screen_url,
-                    screen_large_url=image.screen_large_url,
-                    small_url=image.small_url,
-                    super_url=image.super_url,
-                    thumb_url=image.thumb_url,
-                    tiny_url=image.tiny_url
-                )
-            ).scalars().first()
+            url_hash = cls.compute_url_hash(image)
         elif api_result is not None:
-            return session.execute(
-                select(cls).filter_by(
-                    icon_url=str(getattr(api_result, 'icon_url', None)),
-                    medium_url=str(getattr(api_result, 'medium_url', None)),
-                    original_url=str(getattr(api_result, 'original_url', None)),
-                    screen_url=str(getattr(api_result, 'screen_url', None)),
-                    screen_large_url=str(getattr(api_result, 'screen_large_url', None)),
-                    small_url=str(getattr(api_result, 'small_url', None)),
-                    super_url=str(getattr(api_result, 'super_url', None)),
-                    thumb_url=str(getattr(api_result, 'thumb_url', None)),
-                    tiny_url=str(getattr(api_result, 'tiny_url', None))
-                )
-            ).scalars().first()
+            url_hash = cls.compute_url_hash(api_result)
+        else:
+            return None
+        return session.execute(
+            select(cls).filter_by(url_hash=url_hash)
+        ).scalars().first()
 
 
 class Video(Base, GBEntity, GBDownloadable):
@@ -389,6 +712,11 @@ class Video(Base, GBEntity, GBDownloadable):
     __collection_name__ = 'videos'
     __type_id__ = 2300
     __marshmallow_schema__ = VideoSchema
+    __table_args__ = (
+        Index('ix_video_publish_date', 'publish_date'),
+        Index('ix_video_video_show_id_publish_date', 'video_show_id', 'publish_date'),
+        Index('ix_video_video_categories_id_publish_date', 'video_categories_id', 'publish_date')
+    )
 
     api_detail_url = Column(String)
     '''URL pointing to the video resource.'''
@@ -564,9 +892,31 @@ def get_entity_class_by_item_name(item_name: str) -> Type[GBBase]:
 
 def from_api(session, entity_type: Type[GBBase], result):
     if isinstance(result, list):
-        return [entity_type.from_api_result(session, r) for r in result]
+        return entity_type.bulk_from_api_results(session, result)
     else:
         return entity_type.from_api_result(session, result)
 
 
-Base.metadata.create_all(engine)
+def database_engine(entity_type) -> Engine:
+    """Returns the engine of the database file that a model's table is stored in."""
+    if getattr(entity_type, '__database__', catalog_database) == operational_database:
+        return operational_engine
+    return engine
+
+
+def database_tables(database: str) -> list[Table]:
+    """Returns the tables stored in a database file."""
+    return [
+        mapper.local_table
+        for mapper in Base.registry.mappers
+        if getattr(mapper.class_, '__database__', catalog_database) == database
+    ]
+
+
+# A session that changes rows in both files commits each file separately, in the order it first used them, so a commit
+# is not atomic across the files. The downloader changes the download before the object, so a crash between the two
+# commits can leave a complete Download and its File while the object's file_id, such as Image.file_id, is not set.
+# The object then looks not downloaded and downloading it again links it to the stored content.
+Session.configure(binds={table: operational_engine for table in database_tables(operational_database)})
+Base.metadata.create_all(engine, tables=database_tables(catalog_database))
+Base.metadata.create_all(operational_engine, tables=database_tables(operational_database))
@@ -0,0 +1,115 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, TypeVar
+
+from server.database import Session
+
+T = TypeVar('T')
+
+
+class WriteUnit:
+    def __init__(self, write: Callable[[Session], any]):
+        self.write = write
+        self.future = Future()
+
+
+class DatabaseWriter:
+    """
+    Runs database writes on a single thread so writers never compete for the sqlite write lock. Writes are submitted
+    as units, functions that take a session, and the units that arrive within a few milliseconds of each other are
+    committed together in one transaction. Reads stay on their own sessions.
+
+    Units should only touch the database. If one unit in a group fails, the group is rolled back and its units are run
+    again one transaction each, so the failure only affects its own unit.
+    """
+    group_interval = 0.005
+    '''How long the writer waits for more units before committing a group.'''
+    max_group_size = 200
+
+    def __init__(self):
+        self.logger = logging.getLogger('gbmm').getChild('db-writer')
+        self.__queue: queue.SimpleQueue[WriteUnit] = queue.SimpleQueue()
+        self.__lock = threading.Lock()
+        self.__thread = None
+        self.groups = 0
+        self.units = 0
+
+    def __start(self):
+        with self.__lock:
+            if self.__thread is None:
+                self.__thread = threading.Thread(target=self.__writer, daemon=True)
+                self.__thread.start()
+
+    def submit(self, write: Callable[[Session], T]) -> 'Future[T]':
+        """
+        Queues a write.
+        :param write: Makes the changes using the session it is given. Must not commit or roll back, and should
+        return plain values rather than database objects, which are detached once the group is committed.
+        :return: A future that resolves to the return value of the write once it has been committed.
+        """
+        self.__start()
+        unit = WriteUnit(write)
+        self.__queue.put(unit)
+        return unit.future
+
+    def write(self, write: Callable[[Session], T]) -> T:
+        """Queues a write and waits for it to be committed. Exceptions raised by the write are raised here."""
+        return self.submit(write).result()
+
+    def __writer(self):
+        session = Session()
+        while True:
+            group = [self.__queue.get()]
+            deadline = time.monotonic() + DatabaseWriter.group_interval
+            while len(group) < DatabaseWriter.max_group_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    group.append(self.__queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+
+            if not self.__commit(session, group):
+                for unit in group:
+                    self.__commit(session, [unit])
+
+    def __commit(self, session: Session, group: list[WriteUnit]) -> bool:
+        """
+        Runs a group of units in one transaction.
+        :return: False if a unit in a group of several failed and the group was rolled back without resolving it.
+        """
+        results = []
+        try:
+            for unit in group:
+                results.append(unit.write(session))
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            if len(group) > 1:
+                return False
+            self.logger.warning(f'Database write failed. {type(e).__name__}: {e}')
+            group[0].future.set_exception(e)
+            return True
+        finally:
+            # Objects must not outlive the group, or later groups could write stale state
+            session.expunge_all()
+
+        self.groups += 1
+        self.units += len(group)
+        for unit, result in zip(group, results):
+            unit.future.set_result(result)
+        return True
+
+    def dump(self):
+        return {
+            'queued': self.__queue.qsize(),
+            'groups': self.groups,
+            'units': self.units
+        }
+
+
+db_writer = DatabaseWriter()
@@ -1,9 +1,22 @@
+import json
+import os
+import copy
+import heapq
+from abc import ABC, abstractmethod
 import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import ThreadPoolExecutor, wait
 from datetime import datetime
 from pathlib import Path
 import logging
+from typing import Optional, Callable
+from urllib.parse import urlsplit
+
 import requests
-from sqlalchemy import select
+from requests.structures import CaseInsensitiveDict
+from sqlalchemy import select, update, event, or_, and_
+from sqlalchemy.exc import SQLAlchemyError
 from tqdm import tqdm
 import sys
 import traceback
@@ -11,7 +24,13 @@ import traceback
 from config import config
 import server.gb_api as gb_api
 from server import database
-from server.database import Session, File, Download, DatabaseError, GBDownloadable
+from server.body_reader import BodyReader, preallocate
+from server.database import Session, File, Download, Video, Image, DatabaseError, GBDownloadable
+from server.db_writer import db_writer
+from server.file_store import file_store
+from server.http_pool import http_pool
+from server.progress import progress_tracker, DownloadProgress
+from server.requester import RequestPriority
 
 
 class DownloadFailedError(Exception):
@@ -19,86 +38,1038 @@ class DownloadFailedError(Exception):
         self.msg = msg
 
 
+class Segment:
+    """A byte range of a segmented download, and how much of it has been written to the file."""
+    def __init__(self, start: int, end: int, downloaded: int = 0):
+        self.start = start
+        self.end = end
+        '''Position of the last byte of the segment, inclusive.'''
+        self.downloaded = downloaded
+
+    @property
+    def position(self) -> int:
+        """Position of the next byte to download."""
+        return self.start + self.downloaded
+
+    @property
+    def complete(self) -> bool:
+        return self.position > self.end
+
+    @staticmethod
+    def dumps(segments: list['Segment']) -> str:
+        return json.dumps([[segment.start, segment.end, segment.downloaded] for segment in segments])
+
+    @staticmethod
+    def loads(value: str) -> list['Segment']:
+        return [Segment(start, end, downloaded) for start, end, downloaded in json.loads(value)]
+
+
+class QueuedDownload:
+    """The fields of a queued download needed to schedule it, so the scheduler never has to read the database."""
+    def __init__(self, download_id: int, priority: int, created_time: datetime, url: str, obj_item_name: str,
+                 url_field: str, size_bytes: Optional[int], length_seconds: Optional[int],
+                 video_show_id: Optional[int]):
+        self.id = download_id
+        self.priority = priority if priority is not None else 0
+        self.created_time = created_time if created_time is not None else datetime.min
+        self.host = urlsplit(url).netloc
+        self.obj_item_name = obj_item_name
+        self.url_field = url_field
+        self.size_bytes = size_bytes
+        '''Size of the download if a previous attempt received it from the server.'''
+        self.length_seconds = length_seconds
+        '''Length of the video being downloaded, if the download is a video.'''
+        self.video_show_id = video_show_id
+
+    @staticmethod
+    def of(download: Download, obj: Optional[GBDownloadable]) -> 'QueuedDownload':
+        """
+        :param download: The download.
+        :param obj: The object being downloaded, used for the length and show of videos.
+        """
+        return QueuedDownload(
+            download.id, download.priority, download.created_time, download.url, download.obj_item_name,
+            download.obj_url_field, download.size_bytes, getattr(obj, 'length_seconds', None),
+            getattr(obj, 'video_show_id', None)
+        )
+
+    @staticmethod
+    def load_queued(session: Session) -> list['QueuedDownload']:
+        """Reads every queued download from the database, with the length and show of videos."""
+        rows = session.execute(
+            select(
+                Download.id, Download.priority, Download.created_time, Download.url, Download.obj_item_name,
+                Download.obj_url_field, Download._size_bytes, Video.length_seconds, Video.video_show_id
+            )
+            .outerjoin(Video, and_(Download.obj_item_name == Video.__item_name__, Download.obj_id == Video.id))
+            .filter(Download.status == Download.DownloadStatus.QUEUED)
+        )
+        return [QueuedDownload(*row) for row in rows]
+
+
+class DownloadScheduler(ABC):
+    """
+    Decides the order queued downloads start in. The queued downloads are held in memory, loaded from the database
+    once at startup and kept up to date as downloads are enqueued, paused, resumed, cancelled and reprioritized. The
+    database remains the durable record of the queue.
+    """
+    name: str
+    '''Name of the policy in the downloads.scheduler setting.'''
+
+    def __init__(self):
+        self._entries: dict[int, QueuedDownload] = {}
+        '''The current entry of each queued download. Stale entries left in other structures are skipped.'''
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _is_current(self, entry: QueuedDownload) -> bool:
+        return self._entries.get(entry.id) is entry
+
+    @abstractmethod
+    def _add(self, entry: QueuedDownload):
+        """Adds an entry to the structure the policy pops from."""
+
+    @abstractmethod
+    def pop(self, can_start: Callable[[QueuedDownload], bool]) -> Optional[QueuedDownload]:
+        """
+        Removes and returns the next queued download that can start now.
+        :param can_start: Called with queued downloads in the order of the policy until it returns True.
+        :return: The download, or None if no queued download can start.
+        """
+
+    def entries(self) -> list[QueuedDownload]:
+        return list(self._entries.values())
+
+    def push(self, entry: QueuedDownload):
+        self._entries[entry.id] = entry
+        self._add(entry)
+
+    def remove(self, download_id: int):
+        self._entries.pop(download_id, None)
+
+    def reprioritize(self, download_id: int, priority: int):
+        entry = self._entries.get(download_id)
+        if entry is not None and entry.priority != priority:
+            entry = copy.copy(entry)
+            entry.priority = priority
+            self.push(entry)
+
+    def _pop_heap(self, heap: list[tuple], can_start: Callable[[QueuedDownload], bool]) -> Optional[QueuedDownload]:
+        """Pops the first current entry that can start from a heap of tuples ending in the entry."""
+        skipped = []
+        try:
+            while len(heap) > 0:
+                item = heapq.heappop(heap)
+                entry = item[-1]
+                if not self._is_current(entry):
+                    continue
+                if can_start(entry):
+                    del self._entries[entry.id]
+                    return entry
+                skipped.append(item)
+            return None
+        finally:
+            for item in skipped:
+                heapq.heappush(heap, item)
+
+    def dump(self):
+        return {
+            'scheduler': self.name,
+            'length': len(self._entries),
+            'hosts': dict(Counter(entry.host for entry in self._entries.values()))
+        }
+
+
+class HeapScheduler(DownloadScheduler):
+    """A scheduler that starts downloads in the order of a sort key."""
+    def __init__(self):
+        super().__init__()
+        self.__heap: list[tuple] = []
+
+    @abstractmethod
+    def key(self, entry: QueuedDownload) -> tuple:
+        """Returns the sort key of an entry. Entries with the lowest key start first."""
+
+    def _add(self, entry: QueuedDownload):
+        # The ID breaks ties so entries are never compared
+        heapq.heappush(self.__heap, (*self.key(entry), entry.id, entry))
+
+    def pop(self, can_start: Callable[[QueuedDownload], bool]) -> Optional[QueuedDownload]:
+        return self._pop_heap(self.__heap, can_start)
+
+
+class PriorityScheduler(HeapScheduler):
+    """Starts downloads with the lowest priority first, then the oldest first."""
+    name = 'priority'
+
+    def key(self, entry: QueuedDownload) -> tuple:
+        return entry.priority, entry.created_time
+
+
+class FifoScheduler(HeapScheduler):
+    """Starts the oldest downloads first."""
+    name = 'fifo'
+
+    def key(self, entry: QueuedDownload) -> tuple:
+        return entry.created_time,
+
+
+class ShortestFirstScheduler(HeapScheduler):
+    """
+    Starts the downloads expected to be smallest first, so images and short videos become available quickly while long
+    videos wait. Sizes not yet known are estimated from the length of the video.
+    """
+    name = 'shortest first'
+    bytes_per_second = {
+        'hd_url': 1000000,
+        'high_url': 400000,
+        'low_url': 190000
+    }
+    '''Approximate bitrate of each video quality, used to estimate the size of a video from its length.'''
+    unknown_size = 1000000
+    '''Estimated size of downloads with no known size or length, such as images.'''
+
+    @staticmethod
+    def expected_bytes(entry: QueuedDownload) -> int:
+        if entry.size_bytes:
+            return entry.size_bytes
+        bytes_per_second = ShortestFirstScheduler.bytes_per_second.get(entry.url_field)
+        if bytes_per_second is not None and entry.length_seconds:
+            return entry.length_seconds * bytes_per_second
+        return ShortestFirstScheduler.unknown_size
+
+    def key(self, entry: QueuedDownload) -> tuple:
+        return ShortestFirstScheduler.expected_bytes(entry), entry.created_time
+
+
+class RoundRobinScheduler(DownloadScheduler):
+    """
+    Takes turns between video shows, so a large backlog of one show cannot hold up the others. Within a show, downloads
+    start in priority order, then oldest first. Downloads that are not part of a show, such as images, share a turn.
+    """
+    name = 'round robin'
+
+    def __init__(self):
+        super().__init__()
+        self.__shows: dict[Optional[int], list[tuple]] = {}
+        '''A heap of downloads for each show.'''
+        self.__turns: deque[Optional[int]] = deque()
+        '''Shows in the order of their next turn.'''
+
+    def _add(self, entry: QueuedDownload):
+        heap = self.__shows.get(entry.video_show_id)
+        if heap is None:
+            heap = []
+            self.__shows[entry.video_show_id] = heap
+            self.__turns.append(entry.video_show_id)
+        heapq.heappush(heap, (entry.priority, entry.created_time, entry.id, entry))
+
+    def pop(self, can_start: Callable[[QueuedDownload], bool]) -> Optional[QueuedDownload]:
+        for video_show_id in list(self.__turns):
+            heap = self.__shows[video_show_id]
+            entry = self._pop_heap(heap, can_start)
+            if len(heap) == 0:
+                # Nothing left for this show
+                del self.__shows[video_show_id]
+                self.__turns.remove(video_show_id)
+            if entry is not None:
+                if video_show_id in self.__shows:
+                    # The show has had its turn
+                    self.__turns.remove(video_show_id)
+                    self.__turns.append(video_show_id)
+                return entry
+        return None
+
+
+schedulers: dict[str, type[DownloadScheduler]] = {
+    s.name: s for s in (PriorityScheduler, FifoScheduler, ShortestFirstScheduler, RoundRobinScheduler)
+}
+
+
 class Downloader:
     headers = config.HEADERS
     chunk_size = 10 * 1024 * 1024  # 10 MB
+    '''The largest chunk read at once. Chunks start smaller and grow while the download is fast.'''
+    segment_chunk_size = 1024 * 1024  # 1 MB
+    small_chunk_size = 64 * 1024  # 64 KB
+    small_batch_size = 50
+    '''The most small files claimed and recorded together.'''
+    truncated_retries = 3
+    '''How many times a download whose response ended early is resumed before it fails.'''
+    segmented_fields = ['hd_url']
+    '''URL fields whose files are large enough to be worth downloading in segments.'''
+    after_commit_key = 'downloader_after_commit'
+    '''Key in Session.info of the actions to run when the session commits.'''
+    idle_timeout = 60
+    '''Seconds an idle worker waits before checking the queue again without being notified.'''
 
     def __init__(self):
         self.logger = logging.getLogger('gbmm').getChild('downloader')
         self.__download_pushed_condition = threading.Condition()
-        self.logger.debug('Starting downloader daemon')
-        self.session = Session()
-        self.__daemon = threading.Thread(target=self.__processor, daemon=True).start()
+        self.__workers: dict[int, threading.Thread] = {}
+        self.__worker_count = 0
+        self.__host_downloads = Counter()
+        '''Number of downloads currently running from each host.'''
+        self.__stop_requests: dict[int, Download.DownloadStatus] = {}
+        '''Running downloads that should stop after their current chunk, and the status to leave them in.'''
+        self.__small_recording: set[int] = set()
+        '''Small file downloads whose results are being recorded. Too late to pause or cancel.'''
+        self.__scheduler = Downloader.__create_scheduler(config.DOWNLOAD_SCHEDULER)
+        self.__truncated_attempts: Counter[int] = Counter()
+        '''How many times each download has been resumed after its response ended early.'''
+        self.__small_queue: deque[QueuedDownload] = deque()
+        '''Queued downloads for the small file lane, in the order they were queued.'''
+
+        # Downloads left in progress were interrupted when the server stopped. Queue them again to restart them.
+        with Session.begin() as session:
+            session.execute(
+                update(Download)
+                .where(Download.status == Download.DownloadStatus.IN_PROGRESS)
+                .values(status=Download.DownloadStatus.QUEUED)
+            )
+            for entry in QueuedDownload.load_queued(session):
+                self.__queue(entry)
+
+        event.listen(Session, 'after_commit', Downloader.__run_after_commit)
+        event.listen(Session, 'after_soft_rollback', Downloader.__discard_after_commit)
+
+        self.logger.debug('Starting downloader workers')
+        self.resize(config.DOWNLOAD_WORKERS)
+        threading.Thread(target=self.__small_lane, daemon=True).start()
 
     @staticmethod
     def __api_key_string():
         return f'?{config.API_KEY_FIELD}={config.API_KEY}'
 
-    def __peek_download(self):
-        with self.session:
-            peeked = self.session.execute(
-                select(Download)
-                .filter_by(status=Download.DownloadStatus.IN_PROGRESS)
-                .order_by(Download.created_time.asc())
-            ).scalars().first()
-
-            # If a download is in progress, return that download. We will restart the download.
-            # This is most likely to happen if the daemon was stopped in the middle of a download.
-            if peeked is not None:
-                return peeked
-
-            peeked = self.session.execute(
-                select(Download)
-                .filter_by(status=Download.DownloadStatus.QUEUED)
-                .order_by(Download.created_time.asc())
-            ).scalars().first()
-        return peeked
-
-    def __processor(self):
-        daemon_logger = self.logger.getChild('daemon')
-        daemon_logger.debug('Downloader daemon processor thread started')
+    @staticmethod
+    def __create_scheduler(name: str) -> DownloadScheduler:
+        scheduler_type = schedulers.get(name)
+        if scheduler_type is None:
+            raise ValueError(f'Unknown download scheduler "{name}".')
+        return scheduler_type()
+
+    def set_scheduler(self, name: str):
+        """Changes the policy that decides the order queued downloads start in. Queued downloads are kept."""
+        scheduler = Downloader.__create_scheduler(name)
+        with self.__download_pushed_condition:
+            for entry in self.__scheduler.entries():
+                scheduler.push(entry)
+            self.__scheduler = scheduler
+            self.__download_pushed_condition.notify_all()
+        self.logger.info(f'Downloader using the {name} scheduler.')
+
+    def resize(self, worker_count: int):
+        """
+        Changes the number of downloads that run at the same time. Workers above the new count stop once they have
+        finished their current download.
+        :param worker_count: The number of workers. At least one worker is always kept.
+        """
+        with self.__download_pushed_condition:
+            self.__worker_count = max(worker_count, 1)
+            for index in range(self.__worker_count):
+                if index not in self.__workers:
+                    worker = threading.Thread(target=self.__worker, args=(index,), daemon=True)
+                    self.__workers[index] = worker
+                    worker.start()
+            self.__download_pushed_condition.notify_all()
+        self.logger.info(f'Downloader running {self.__worker_count} workers.')
+
+    def __reserve(self) -> Optional[QueuedDownload]:
+        """
+        Pops the next queued download whose host is below its concurrency limit and takes a slot of its host. Must be
+        called while holding the download pushed condition.
+        :return: The reserved queue entry, or None if no download can be started right now.
+        """
+        entry = self.__scheduler.pop(lambda e: self.__host_downloads[e.host] < config.DOWNLOAD_HOST_LIMIT)
+        if entry is not None:
+            self.__host_downloads[entry.host] += 1
+        return entry
+
+    def __release(self, host: str, count: int = 1):
+        """Frees slots of a host and wakes workers that were waiting on them."""
+        with self.__download_pushed_condition:
+            self.__host_downloads[host] -= count
+            self.__download_pushed_condition.notify_all()
+
+    def __reserve_connections(self, host: str, segment_count: int) -> int:
+        """
+        Takes free slots of a host for the extra connections of a segmented download. The download already holds one
+        slot for its first connection. A download never opens more connections than the pool keeps open to its host.
+        :return: The number of extra slots taken, which must be freed with __release.
+        """
+        with self.__download_pushed_condition:
+            free = config.DOWNLOAD_HOST_LIMIT - self.__host_downloads[host]
+            extra = max(min(segment_count, config.HTTP_POOL_SIZE, free + 1) - 1, 0)
+            self.__host_downloads[host] += extra
+            return extra
+
+    def __claim(self, session: Session, entry: QueuedDownload) -> Optional[Download]:
+        """
+        Claims a reserved download by moving it to in progress. Runs without holding the download pushed condition, so
+        enqueues and the API never wait on the database write. The claim only succeeds if the download is still queued
+        in the database, so a download is never claimed twice. Workers commit on their own session rather than through
+        the database writer, because the rest of the download runs on the objects loaded by that session.
+        :return: The claimed download, or None if the download was not claimed. Its host slot has been freed.
+        """
+        try:
+            result = session.execute(
+                update(Download)
+                .where(Download.id == entry.id, Download.status == Download.DownloadStatus.QUEUED)
+                .values(status=Download.DownloadStatus.IN_PROGRESS)
+            )
+            session.commit()
+        except SQLAlchemyError:
+            self.logger.exception('Failed to claim a download from the queue.')
+            session.rollback()
+            with self.__download_pushed_condition:
+                self.__host_downloads[entry.host] -= 1
+                self.__scheduler.push(entry)
+                self.__download_pushed_condition.wait(Downloader.idle_timeout)
+            return None
+
+        if result.rowcount == 1:
+            return session.get(Download, entry.id)
+        # A download that is no longer queued was paused or cancelled after it was popped. Skip it.
+        self.__release(entry.host)
+        return None
+
+    def __worker(self, index: int):
+        worker_logger = self.logger.getChild(f'worker-{index}')
+        worker_logger.debug('Downloader worker thread started')
+        session = Session()
+        try:
+            while True:
+                with self.__download_pushed_condition:
+                    entry = None
+                    while entry is None:
+                        if index >= self.__worker_count:
+                            del self.__workers[index]
+                            worker_logger.debug('Downloader worker thread stopped')
+                            return
+                        entry = self.__reserve()
+                        if entry is None:
+                            worker_logger.debug(f'Downloader worker awaiting notification.')
+                            self.__download_pushed_condition.wait(Downloader.idle_timeout)
+
+                download = self.__claim(session, entry)
+                if download is None:
+                    continue
+
+                worker_logger.debug(f'Dequeued download: {download}')
+                try:
+                    self.__download(session, download)
+                except Exception:
+                    worker_logger.exception(f'Unhandled error in download {download.id}.')
+                    session.rollback()
+                finally:
+                    with self.__download_pushed_condition:
+                        self.__stop_requests.pop(download.id, None)
+                        progress_tracker.stop(download.id)
+                    self.__release(entry.host)
+        finally:
+            session.close()
+
+    @staticmethod
+    def __after_commit(session: Session, action: Callable[[], None]):
+        """
+        Runs an action once the session commits, such as adding a new download to the queue. Workers must not see a
+        download before it is committed. The action is discarded if the session rolls back.
+        """
+        session.info.setdefault(Downloader.after_commit_key, []).append(action)
+
+    @staticmethod
+    def __run_after_commit(session: Session):
+        for action in session.info.pop(Downloader.after_commit_key, []):
+            action()
+
+    @staticmethod
+    def __discard_after_commit(session: Session, previous_transaction):
+        session.info.pop(Downloader.after_commit_key, None)
+
+    @staticmethod
+    def __is_small(entry: QueuedDownload) -> bool:
+        """Images, and downloads already known to be small, go to the small file lane."""
+        if entry.obj_item_name == Image.__item_name__:
+            return True
+        return entry.size_bytes is not None and 0 < entry.size_bytes < config.DOWNLOAD_SMALL_FILE_SIZE * 1000
+
+    def __queue(self, entry: QueuedDownload):
+        with self.__download_pushed_condition:
+            if Downloader.__is_small(entry):
+                self.__small_queue.append(entry)
+            else:
+                self.__scheduler.push(entry)
+            self.__download_pushed_condition.notify_all()
+            self.logger.debug(f"Download queue condition notified")
+
+    def __update_queue(self, update_queue: Callable[[DownloadScheduler], None]):
+        with self.__download_pushed_condition:
+            update_queue(self.__scheduler)
+            self.__download_pushed_condition.notify_all()
+            self.logger.debug(f"Download queue condition notified")
+
+    def __small_lane(self):
+        """
+        Downloads small files, such as the images of a video, separately from the worker pool so they never wait
+        behind large videos. Queued small files are taken in batches and each batch is fetched at the same time.
+        """
+        lane_logger = self.logger.getChild('small-lane')
+        lane_logger.debug('Small file lane thread started')
+        session = Session()
         while True:
             with self.__download_pushed_condition:
-                while self.__peek_download() is None:
-                    daemon_logger.debug(f'Downloader daemon awaiting notification.')
-                    self.__download_pushed_condition.wait()
-                    daemon_logger.debug(f'Downloader daemon received notification.')
+                while len(self.__small_queue) == 0:
+                    self.__download_pushed_condition.wait(Downloader.idle_timeout)
+                batch_size = min(len(self.__small_queue), Downloader.small_batch_size)
+                batch = [self.__small_queue.popleft() for _ in range(batch_size)]
+
+            try:
+                self.__download_small_batch(session, batch)
+            except Exception:
+                lane_logger.exception('Unhandled error in small file batch.')
+                session.rollback()
+                # Nothing else will pick the claimed downloads up again
+                ids = [entry.id for entry in batch]
+                try:
+                    db_writer.write(lambda write_session: write_session.execute(
+                        update(Download)
+                        .where(Download.id.in_(ids), Download.status == Download.DownloadStatus.IN_PROGRESS)
+                        .values(status=Download.DownloadStatus.FAILED, failed_reason='Unexpected error.')
+                    ).rowcount)
+                except Exception:
+                    lane_logger.exception('Failed to mark the downloads of a failed small file batch as failed.')
+            finally:
+                # Batches are claimed by the database writer. A transaction left open here would read from before the
+                # next claim.
+                session.close()
+
+    @staticmethod
+    def __fetch_small_file(job: tuple[str, str, int, Optional[str]]) \
+            -> tuple[Optional[CaseInsensitiveDict], int, Optional[str], Optional[str]]:
+        """
+        Fetches a small file over a pooled connection and writes it to its path. A file that ended early on a previous
+        attempt continues from its offset if the server confirms the file has not changed. Runs on a lane thread, so
+        it must not touch the session.
+        :param job: The URL, the destination path, the offset to continue from and the validator for If-Range.
+        :return: The response headers, the size of the file, the content hash and the reason the download failed, or
+        None.
+        """
+        url, path, offset, validator = job
+        try:
+            if offset > 0:
+                range_headers = {**Downloader.headers, 'Range': f'bytes={offset}-', 'If-Range': validator}
+                response = http_pool.get(url, headers=range_headers, stream=True)
+                if response.status_code == 416:
+                    # Range not satisfiable. The file on the server has changed size.
+                    response.close()
+                    response = http_pool.get(url, headers=Downloader.headers, stream=True)
+            else:
+                response = http_pool.get(url, headers=Downloader.headers, stream=True)
+
+            with response:
+                if not response.ok:
+                    return response.headers, 0, None, \
+                        f'Bad response from request to download URL: {response.status_code}'
+                if response.status_code != 206 or \
+                        not response.headers.get('Content-Range', '').startswith(f'bytes {offset}-'):
+                    # The server refused the range or the file has changed. Write the whole response.
+                    offset = 0
+
+                Path(path).parent.absolute().mkdir(parents=True, exist_ok=True)
+                if offset > 0:
+                    content_hash = file_store.hasher(path, offset)
+                else:
+                    content_hash = file_store.hasher()
+                    file_store.release(path)
+                written = offset
+                with open(path, 'r+b' if offset > 0 else 'wb') as handle:
+                    # Drop anything written after the recorded offset
+                    handle.seek(offset)
+                    handle.truncate()
+                    for data in response.iter_content(Downloader.small_chunk_size):
+                        handle.write(data)
+                        content_hash.update(data)
+                        written += len(data)
+                return response.headers, written, content_hash.hexdigest(), None
+
+        except (requests.RequestException, OSError) as e:
+            return None, 0, None, f'{type(e).__name__}: {e}'
+
+    def __download_small_batch(self, session: Session, batch: list[QueuedDownload]):
+        """
+        Downloads a batch of small files at the same time. The batch is claimed with one update and the results are
+        recorded with one commit.
+        """
+        start_time = datetime.now()
+        ids = [entry.id for entry in batch]
+        db_writer.write(lambda write_session: write_session.execute(
+            update(Download)
+            .where(Download.id.in_(ids), Download.status == Download.DownloadStatus.QUEUED)
+            .values(status=Download.DownloadStatus.IN_PROGRESS, start_time=start_time)
+        ).rowcount)
+
+        # Downloads paused or cancelled since they were queued were not claimed
+        downloads = session.execute(
+            select(Download).where(Download.id.in_(ids), Download.status == Download.DownloadStatus.IN_PROGRESS)
+        ).scalars().all()
+        if len(downloads) == 0:
+            return
+
+        # Pause and cancel requests that arrived before the fetch. Requests that arrive during it are taken below.
+        with self.__download_pushed_condition:
+            stop_requested = set(self.__stop_requests.keys()) & {download.id for download in downloads}
+
+        objects = {}
+        for item_name in {download.obj_item_name for download in downloads}:
+            entity_type = database.get_entity_class_by_item_name(item_name)
+            obj_ids = [download.obj_id for download in downloads if download.obj_item_name == item_name]
+            for obj in session.execute(select(entity_type).where(entity_type.id.in_(obj_ids))).scalars():
+                objects[(item_name, obj.id)] = obj
+
+        # Content that has already been downloaded from the same URL is linked instead of fetched
+        stored = Downloader.__stored_files(session, [download.url for download in downloads])
+        linked = 0
+        if len(stored) > 0:
+            remaining = []
+            for download in downloads:
+                source = stored.get(download.url)
+                obj = objects.get((download.obj_item_name, download.obj_id))
+                if source is not None and obj is not None and download.id not in stop_requested and \
+                        Downloader.__complete_from_store(session, download, obj, source):
+                    linked += 1
+                else:
+                    remaining.append(download)
+            downloads = remaining
+
+        failed = 0
+        stopped = 0
+        files = []
+        remaining = []
+        for download in downloads:
+            if download.id in stop_requested:
+                download.status = self.__take_stop_request(download.id)
+                stopped += 1
+                continue
+            if download.url is None:
+                # Objects often leave some of their URL fields empty
+                download.status = Download.DownloadStatus.FAILED
+                download.failed_reason = f'No URL in field {download.obj_url_field}.'
+                failed += 1
+                continue
+            files.append(Downloader.__get_file(session, download))
+            remaining.append(download)
+        downloads = remaining
+
+        api_key_string = Downloader.__api_key_string()
+        jobs = []
+        for download, file in zip(downloads, files):
+            # A small file that ended early continues from where it stopped, like any other download
+            offset = Downloader.__resume_offset(download)
+            validator = Downloader.__validator(download) if offset > 0 else None
+            jobs.append((f'{download.url}{api_key_string}', file.path, offset if validator is not None else 0,
+                         validator))
+        with ThreadPoolExecutor(max_workers=max(min(config.DOWNLOAD_SMALL_FILE_WORKERS, len(jobs)), 1)) as executor:
+            results = list(executor.map(Downloader.__fetch_small_file, jobs))
+
+        completed = 0
+        truncated = 0
+        finish_time = datetime.now()
+        # Take the requests that arrived during the fetch. Later requests are refused until the results are committed.
+        with self.__download_pushed_condition:
+            stop_requests = {
+                download.id: self.__stop_requests.pop(download.id)
+                for download in downloads if download.id in self.__stop_requests
+            }
+            self.__small_recording.update(ids)
+        for download, file, (headers, written, content_hash, failed_reason) in zip(downloads, files, results):
+            stopped_status = stop_requests.get(download.id)
+            if stopped_status is not None:
+                # Small files are fetched whole, so a paused download starts over. Drop what was written.
+                if failed_reason is None and written > 0:
+                    Downloader.__remove_partial(file.path)
+                download.status = stopped_status
+                download.downloaded_bytes = 0
+                stopped += 1
+                continue
+
+            if headers is not None:
+                download.response_headers = headers
+            if failed_reason is not None:
+                self.logger.error(f'Download failed for {download.url}: {failed_reason}')
+                download.status = Download.DownloadStatus.FAILED
+                download.failed_reason = failed_reason
+                failed += 1
+                continue
+
+            session.add(file)
+            download.file = file
+            obj = objects.get((download.obj_item_name, download.obj_id))
+            if self.__requeue_truncated(session, download, obj, written):
+                truncated += 1
+                continue
+
+            file.content_type = download.content_type
+            file_store.add(file, content_hash)
+            if obj is not None:
+                obj.file = file
+            download.downloaded_bytes = written
+            download.status = Download.DownloadStatus.COMPLETE
+            download.finish_time = finish_time
+            completed += 1
+        try:
+            # Committed on the lane's own session rather than the database writer. The results are made on objects
+            # loaded here, next to files moved into the file store and truncated downloads queued again, none of
+            # which the writer could repeat if it had to run the write a second time.
+            session.commit()
+        finally:
+            with self.__download_pushed_condition:
+                self.__small_recording.difference_update(ids)
+                for download_id in ids:
+                    self.__stop_requests.pop(download_id, None)
+
+        self.logger.info(f'Downloaded {completed} small files, {failed} failed, {stopped} paused or cancelled, '
+                         f'{truncated} ended early, {linked} linked to stored content, in '
+                         f'{(finish_time - start_time).total_seconds():.2f}s.')
+
+    def dump(self):
+        with self.__download_pushed_condition:
+            return {
+                'queue': self.__scheduler.dump(),
+                'small_queue': len(self.__small_queue),
+                'workers': self.__worker_count,
+                'running_workers': len(self.__workers),
+                'host_downloads': {host: count for host, count in self.__host_downloads.items() if count > 0}
+            }
+
+    def __requeue_truncated(self, session: Session, download: Download, obj: Optional[GBDownloadable],
+                            downloaded_bytes: int) -> bool:
+        """
+        Checks whether a response ended before all of its content arrived. A truncated download is queued again to
+        resume from the last byte written, and fails once it has been truncated too many times. The caller commits.
+        :return: True if the download was truncated.
+        """
+        if not download.size_bytes or downloaded_bytes >= download.size_bytes:
+            self.__truncated_attempts.pop(download.id, None)
+            return False
+
+        download.downloaded_bytes = downloaded_bytes
+        attempts = self.__truncated_attempts[download.id] + 1
+        if attempts > Downloader.truncated_retries:
+            del self.__truncated_attempts[download.id]
+            download.status = Download.DownloadStatus.FAILED
+            download.failed_reason = f'Download ended early at {downloaded_bytes}B of {download.size_bytes}B.'
+            self.logger.error(f'Download failed for {download.url}: {download.failed_reason}')
+            return True
+
+        self.__truncated_attempts[download.id] = attempts
+        self.logger.warning(f'Download ended early at {downloaded_bytes}B of {download.size_bytes}B. Resuming, attempt '
+                            f'{attempts} of {Downloader.truncated_retries}.')
+        download.status = Download.DownloadStatus.QUEUED
+        entry = QueuedDownload.of(download, obj)
+        Downloader.__after_commit(session, lambda: self.__queue(entry))
+        return True
+
+    @staticmethod
+    def __record_progress(download_id: int, downloaded_bytes: int, segments: Optional[str] = None):
+        """
+        Records the progress of a running download through the database writer without waiting for it. The update only
+        applies while the download is in progress, so a late write cannot overwrite the final state. Progress only
+        grows, so a late write can only make a resume start earlier than it could have.
+        """
+        values = {'downloaded_bytes': downloaded_bytes}
+        if segments is not None:
+            values['segments'] = segments
+        db_writer.submit(lambda session: session.execute(
+            update(Download)
+            .where(Download.id == download_id, Download.status == Download.DownloadStatus.IN_PROGRESS)
+            .values(**values)
+        ).rowcount)
+
+    @staticmethod
+    def __get_file(session: Session, download: Download) -> File:
+        """Returns the file of a download, the file already saved for the same object and field, or a new file."""
+        if download.file is not None:
+            return download.file
+        file = session.execute(
+            select(File).filter_by(
+                obj_item_name=download.obj_item_name,
+                obj_id=download.obj_id,
+                obj_url_field=download.obj_url_field
+            )
+        ).scalars().first()
+        return file if file is not None else File.create_from_download(download)
+
+    @staticmethod
+    def __stored_files(session: Session, urls: list[str]) -> dict[str, File]:
+        """Returns files already in the file store, by the URL they were downloaded from."""
+        files = session.execute(
+            select(File).where(File.url.in_(urls), File.content_hash.is_not(None))
+        ).scalars()
+        return {file.url: file for file in files}
+
+    @staticmethod
+    def __complete_from_store(session: Session, download: Download, obj: GBDownloadable, source: File) -> bool:
+        """
+        Completes a download by linking its file to the stored content of another file downloaded from the same URL.
+        :return: False if the content could not be linked, and the download has to be fetched.
+        """
+        file = Downloader.__get_file(session, download)
+        if not file_store.link(file, source):
+            return False
+
+        headers = next((d.response_headers for d in source.downloads if d.response_headers is not None), None)
+        if headers is not None:
+            download.response_headers = CaseInsensitiveDict(json.loads(headers))
+        session.add(file)
+        obj.file = file
+        download.file = file
+        download.downloaded_bytes = file.size_bytes
+        download.status = Download.DownloadStatus.COMPLETE
+        download.finish_time = datetime.now()
+        return True
+
+    def __link_stored(self, session: Session, download: Download, obj: GBDownloadable) -> bool:
+        """Completes a download without fetching it if its URL has already been downloaded."""
+        source = Downloader.__stored_files(session, [download.url]).get(download.url)
+        if source is None or not Downloader.__complete_from_store(session, download, obj, source):
+            return False
+        session.commit()
+        self.logger.info(f'Linked {download.url} to stored content {source.content_hash}.')
+        return True
+
+    @staticmethod
+    def __resume_offset(download: Download) -> int:
+        """
+        Returns the offset a previous attempt at a download can be continued from, or 0 if it has to start over. The
+        partial file must hold at least the bytes recorded in downloaded_bytes. Anything past that was written after
+        the last commit and is discarded.
+        """
+        if download.file is None or not download.downloaded_bytes or download.segments is not None:
+            return 0
+        try:
+            size_on_disk = os.path.getsize(download.file.path)
+        except OSError:
+            return 0
+        if size_on_disk < download.downloaded_bytes:
+            return 0
+        return download.downloaded_bytes
 
-            download = self.__peek_download()
-            if download is not None:
-                daemon_logger.debug(f'Dequeued download: {download}')
-                self.__download(download)
+    @staticmethod
+    def __validator(download: Download) -> Optional[str]:
+        """
+        Returns the ETag or Last-Modified date sent with the previous response for a download, for use in If-Range.
+        The server only honours the range if the file still matches. Returns None if there is no usable validator.
+        """
+        if download.response_headers is None:
+            return None
+        headers = CaseInsensitiveDict(json.loads(download.response_headers))
+        etag = headers.get('ETag')
+        # Weak ETags cannot be used with If-Range
+        if etag is not None and not etag.startswith('W/'):
+            return etag
+        return headers.get('Last-Modified')
+
+    @staticmethod
+    def __resume_segments(download: Download) -> Optional[list['Segment']]:
+        """
+        Returns the segments of a segmented download that can be continued, or None. The preallocated file must still
+        be the full size of the download, and the server must be able to confirm the file has not changed.
+        """
+        if download.segments is None or download.file is None or Downloader.__validator(download) is None:
+            return None
+        try:
+            size_on_disk = os.path.getsize(download.file.path)
+        except OSError:
+            return None
+        if size_on_disk != download.size_bytes:
+            return None
+        return Segment.loads(download.segments)
+
+    @staticmethod
+    def __split(download: Download, response: requests.Response) -> Optional[list['Segment']]:
+        """
+        Splits a large download into byte ranges that are fetched over separate connections. Returns None if the
+        download should be fetched in a single stream.
+        """
+        segment_count = config.DOWNLOAD_SEGMENTS
+        if download.obj_url_field not in Downloader.segmented_fields or segment_count < 2:
+            return None
+        if not download.size_bytes or download.size_bytes < config.DOWNLOAD_SEGMENT_THRESHOLD * 1000 * 1000:
+            return None
+        if response.headers.get('Accept-Ranges') != 'bytes' or Downloader.__validator(download) is None:
+            return None
+
+        segment_size = -(-download.size_bytes // segment_count)  # Round up
+        return [
+            Segment(start, min(start + segment_size, download.size_bytes) - 1)
+            for start in range(0, download.size_bytes, segment_size)
+        ]
+
+    def __fetch_segment(self, url: str, path: str, validator: str, segment: 'Segment', progress_lock: threading.Lock,
+                        progress_bar: tqdm, progress: DownloadProgress, stop: threading.Event):
+        """
+        Downloads the rest of a segment into its place in the file. Connection errors are retried from the last byte
+        written, up to the configured number of retries.
+        """
+        attempt = 0
+        while not segment.complete and not stop.is_set():
+            try:
+                headers = {
+                    **Downloader.headers,
+                    'Range': f'bytes={segment.position}-{segment.end}',
+                    'If-Range': validator
+                }
+                with http_pool.get(url, headers=headers, stream=True) as response:
+                    if response.status_code != 206 or \
+                            not response.headers.get('Content-Range', '').startswith(f'bytes {segment.position}-'):
+                        raise DownloadFailedError(
+                            f'Server did not return the requested range: {response.status_code}. The file may have '
+                            f'changed on the server.')
+
+                    with open(path, 'r+b') as handle:
+                        handle.seek(segment.position)
+                        for data in BodyReader(response, Downloader.segment_chunk_size).chunks():
+                            handle.write(data)
+                            with progress_lock:
+                                segment.downloaded += len(data)
+                            progress_bar.update(len(data))
+                            progress_tracker.add(progress.download_id, len(data))
+                            if stop.is_set():
+                                return
+                    if not segment.complete:
+                        raise requests.ConnectionError(f'Segment response ended early at {segment.position}B.')
+
+            except (requests.RequestException, OSError) as e:
+                attempt += 1
+                if attempt > config.DOWNLOAD_SEGMENT_RETRIES:
+                    raise
+                self.logger.warning(f'Segment {segment.start}-{segment.end} failed, retrying from {segment.position}B. '
+                                    f'{e}')
+                time.sleep(min(2 ** attempt, 30))
+
+    def __download_segments(self, session: Session, download: Download, path: str, url: str,
+                            segments: list['Segment'], progress_bar: tqdm, progress: DownloadProgress) -> bool:
+        """
+        Downloads the incomplete segments of a download at the same time. Each connection after the first takes a slot
+        of the host, so segments only run side by side while the host limit allows it and otherwise take turns.
+        Progress is recorded on the download every few seconds so the segments can be resumed after a restart.
+        :return: False if the download was paused or cancelled before it completed.
+        """
+        validator = Downloader.__validator(download)
+        progress_interval = config.DOWNLOAD_PROGRESS_INTERVAL
+        progress_lock = threading.Lock()
+        stop = threading.Event()
+        stopped_status = None
+        pending = [segment for segment in segments if not segment.complete]
+        host = urlsplit(url).netloc
+        extra_connections = self.__reserve_connections(host, len(pending))
+        if extra_connections + 1 < len(pending):
+            self.logger.debug(f'Downloading {len(pending)} segments over {extra_connections + 1} connections.')
+
+        try:
+            with ThreadPoolExecutor(max_workers=extra_connections + 1) as executor:
+                futures = [
+                    executor.submit(
+                        self.__fetch_segment, url, path, validator, segment, progress_lock, progress_bar, progress, stop
+                    )
+                    for segment in pending
+                ]
+                try:
+                    while True:
+                        done, not_done = wait(futures, timeout=1)
+                        if len(not_done) == 0 or stopped_status is not None:
+                            with progress_lock:
+                                download.downloaded_bytes = sum(segment.downloaded for segment in segments)
+                                download.segments = Segment.dumps(segments)
+                            session.commit()
+                        elif progress.flush_due(progress_interval):
+                            with progress_lock:
+                                downloaded_bytes = sum(segment.downloaded for segment in segments)
+                                Downloader.__record_progress(download.id, downloaded_bytes, Segment.dumps(segments))
+
+                        for future in done:
+                            e = future.exception()
+                            if e is None:
+                                continue
+                            if isinstance(e, DownloadFailedError):
+                                # The file has changed on the server. The segments cannot be resumed.
+                                download.segments = None
+                                download.downloaded_bytes = 0
+                            else:
+                                with progress_lock:
+                                    download.downloaded_bytes = sum(segment.downloaded for segment in segments)
+                                    download.segments = Segment.dumps(segments)
+                            raise e
+                        if len(not_done) == 0:
+                            break
+                        if stopped_status is None:
+                            stopped_status = self.__take_stop_request(progress.download_id)
+                            if stopped_status is not None:
+                                # Let the segments stop after their current chunk, then record where they stopped
+                                stop.set()
+                finally:
+                    stop.set()
+        finally:
+            # The executor has waited for every segment, so their connections are back in the pool
+            self.__release(host, extra_connections)
+
+        if stopped_status is not None:
+            self.__stopped(session, download, stopped_status)
+            return False
+        return True
+
+    @staticmethod
+    def __remove_partial(path: str):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def __take_stop_request(self, download_id: int) -> Optional[Download.DownloadStatus]:
+        """Returns the status a running download was asked to stop in, such as paused or cancelled, or None."""
+        with self.__download_pushed_condition:
+            return self.__stop_requests.pop(download_id, None)
 
-    def __download(self, download: Download):
+    def __stopped(self, session: Session, download: Download, status: Download.DownloadStatus):
+        download.status = status
+        session.commit()
+        if status == Download.DownloadStatus.PAUSED:
+            self.logger.info(f'Download paused at {download.downloaded_bytes}B.')
+        else:
+            self.logger.info(f'Download cancelled.')
+
+    def __download(self, session: Session, download: Download):
         url = None
+        response = None
         progress_bar = None
         failed = False
         failed_reason = ''
         exc = None
 
         try:
-            self.session.add(download)
+            session.add(download)
             download.status = Download.DownloadStatus.IN_PROGRESS
             url = f'{download.url}{Downloader.__api_key_string()}'
             entity_type = database.get_entity_class_by_item_name(download.obj_item_name)
             if download.obj_id is None:
                 raise ValueError('Object ID is None.')
-            obj: GBDownloadable = self.session.get(entity_type, download.obj_id)
-            self.session.commit()
+            obj: GBDownloadable = session.get(entity_type, download.obj_id)
+            session.commit()
 
             if obj is None:
                 # The GBEntity data for this download has not been stored to the database yet.
                 # Query the API and store it to the database.
-                obj_data = gb_api.get_one(entity_type, download.obj_id)
-                obj = database.from_api(self.session, entity_type, obj_data)
+                obj_data = gb_api.get_one(entity_type, download.obj_id, RequestPriority.ENQUEUE)
+                obj = database.from_api(session, entity_type, obj_data)
 
             if obj is None:
                 download.status = Download.DownloadStatus.FAILED
                 download.failed_reason = f'Failed to get GBEntity object associated with this download from the GB API.'
-                self.session.commit()
+                session.commit()
                 return
 
-            self.session.add(obj)
+            session.add(obj)
 
             name = None
             if hasattr(obj, 'name'):
@@ -109,61 +1080,138 @@ class Downloader:
             self.logger.info(f'Downloading {obj.__item_name__}: {name} ({obj.id})')
             self.logger.debug(f'Download URL: {url}')
 
-            download.start_time = datetime.now()
-            response = requests.get(url, headers=Downloader.headers, stream=True)
+            if not download.downloaded_bytes and self.__link_stored(session, download, obj):
+                return
 
-            self.logger.debug(f'Response headers:\n{response.headers}')
-            download.response_headers = response.headers
+            segments = Downloader.__resume_segments(download)
+            if segments is not None:
+                # Each segment of a segmented download continues from where it stopped
+                self.logger.info(f'Resuming segmented download from {download.downloaded_bytes}B.')
+                file = download.file
+                progress_bar = tqdm(total=download.size_bytes, initial=download.downloaded_bytes, unit='iB',
+                                    unit_scale=True)
+            else:
+                # Continue from where a previous attempt stopped if the partial file can be trusted
+                offset = Downloader.__resume_offset(download)
+                validator = Downloader.__validator(download) if offset > 0 else None
+                if validator is None:
+                    offset = 0
+                    response = http_pool.get(url, headers=Downloader.headers, stream=True)
+                else:
+                    self.logger.info(f'Resuming download from {offset}B.')
+                    range_headers = {**Downloader.headers, 'Range': f'bytes={offset}-', 'If-Range': validator}
+                    response = http_pool.get(url, headers=range_headers, stream=True)
+                    if response.status_code == 416:
+                        # Range not satisfiable. The file on the server has changed size.
+                        response.close()
+                        response = http_pool.get(url, headers=Downloader.headers, stream=True)
+                    if response.status_code != 206 or \
+                            not response.headers.get('Content-Range', '').startswith(f'bytes {offset}-'):
+                        # The server refused the range or the file has changed. Start over with the full response.
+                        self.logger.info(f'Server did not resume the download. Downloading the whole file.')
+                        offset = 0
 
-            if not response.ok:
-                download.status = Download.DownloadStatus.FAILED
-                download.failed_reason = f'Bad response from request to download URL: {response.status_code}'
-                self.session.commit()
-                return
+                if offset == 0:
+                    download.start_time = datetime.now()
+                    download.downloaded_bytes = 0
+                    download.segments = None
 
-            progress_bar = tqdm(total=download.size_bytes, unit='iB', unit_scale=True)
+                self.logger.debug(f'Response headers:\n{response.headers}')
+                download.response_headers = response.headers
 
-            self.logger.debug(f'Beginning content stream. Chunk size {Downloader.chunk_size}.')
+                if not response.ok:
+                    download.status = Download.DownloadStatus.FAILED
+                    download.failed_reason = f'Bad response from request to download URL: {response.status_code}'
+                    session.commit()
+                    return
 
-            self.session.commit()
+                progress_bar = tqdm(total=download.size_bytes, initial=offset, unit='iB', unit_scale=True)
 
-            # Get or create the file where we will save this download
-            file = self.session.execute(
-                select(File).filter_by(
-                    obj_item_name=download.obj_item_name,
-                    obj_id=download.obj_item_name,
-                    obj_url_field=download.obj_url_field
-                )
-            ).scalars().first()
+                self.logger.debug(f'Beginning content stream. Maximum chunk size {Downloader.chunk_size}.')
 
-            if file is None:
-                file = File.create_from_download(download)
-                self.session.add(file)
+                session.commit()
 
-            # Associate the file with its object and this download
-            obj.file = file
-            download.file = file
+                # Get or create the file where we will save this download
+                file = Downloader.__get_file(session, download)
+                session.add(file)
+
+                # Associate the file with its object and this download
+                obj.file = file
+                download.file = file
+
+                # Create the destination directory if it does not exist
+                Path(file.path).parent.absolute().mkdir(parents=True, exist_ok=True)
+
+                session.commit()
+
+                segments = Downloader.__split(download, response) if offset == 0 else None
+                if segments is not None:
+                    # The segments are fetched over their own connections
+                    response.close()
+                    self.logger.debug(f'Downloading in {len(segments)} segments.')
+                    file_store.release(file.path)
+                    with open(file.path, 'wb') as handle:
+                        preallocate(handle, download.size_bytes)
+                    download.segments = Segment.dumps(segments)
+                    session.commit()
 
-            # Create the destination directory if it does not exist
-            Path(file.path).parent.absolute().mkdir(parents=True, exist_ok=True)
+            # Progress is kept in memory and only written to the database every few seconds
+            download_id = download.id
+            progress = progress_tracker.start(download_id, download.size_bytes, download.downloaded_bytes)
+            progress_interval = config.DOWNLOAD_PROGRESS_INTERVAL
 
-            self.session.commit()
+            if segments is not None:
+                if not self.__download_segments(session, download, file.path, url, segments, progress_bar, progress):
+                    return
+                # Segments arrive out of order, so the content is hashed once the file is complete
+                content_hash = file_store.hasher(file.path, download.size_bytes)
+            else:
+                if offset > 0:
+                    content_hash = file_store.hasher(file.path, offset)
+                else:
+                    content_hash = file_store.hasher()
+                    file_store.release(file.path)
+                with open(file.path, 'r+b' if offset > 0 else 'wb') as handle:
+                    # Drop anything written after the last recorded chunk
+                    handle.seek(offset)
+                    handle.truncate()
+                    preallocate(handle, download.size_bytes)
+                    for data in BodyReader(response, Downloader.chunk_size).chunks():
+                        handle.write(data)
+                        content_hash.update(data)
+                        downloaded_bytes = len(data)
+                        self.logger.debug(f'Downloaded {downloaded_bytes}B of data.')
+                        progress_bar.update(downloaded_bytes)
+                        progress_tracker.add(download_id, downloaded_bytes)
 
-            with open(file.path, 'wb') as handle:
-                for data in response.iter_content(Downloader.chunk_size):
-                    handle.write(data)
-                    downloaded_bytes = len(data)
-                    self.logger.debug(f'Downloaded {downloaded_bytes}B of data.')
-                    progress_bar.update(downloaded_bytes)
-                    download.downloaded_bytes += downloaded_bytes
-                    self.session.commit()
+                        stopped_status = self.__take_stop_request(download_id)
+                        if stopped_status is not None:
+                            # The recorded progress must never run ahead of the file, or a resume would skip data
+                            handle.flush()
+                            download.downloaded_bytes = progress.downloaded_bytes
+                            session.commit()
+                            self.__stopped(session, download, stopped_status)
+                            return
 
+                        if progress.flush_due(progress_interval):
+                            handle.flush()
+                            Downloader.__record_progress(download_id, progress.downloaded_bytes)
+
+                    # Drop any preallocated space the body did not fill
+                    handle.truncate()
+
+                if self.__requeue_truncated(session, download, obj, progress.downloaded_bytes):
+                    session.commit()
+                    return
+
+            file_store.add(file, content_hash.hexdigest())
+            download.downloaded_bytes = progress.downloaded_bytes
             download.status = Download.DownloadStatus.COMPLETE
             download.finish_time = datetime.now()
             self.logger.info(f'Download complete.')
             self.logger.debug(
                 f'Download time {download.finish_time.timestamp() - download.start_time.timestamp()}s')
-            self.session.commit()
+            session.commit()
 
         except ValueError as e:
             more_info = ''
@@ -198,6 +1246,11 @@ class Downloader:
             exc = sys.exc_info()
             failed = True
 
+        except DownloadFailedError as e:
+            failed_reason = e.msg
+            exc = sys.exc_info()
+            failed = True
+
         except DatabaseError as e:
             failed_reason = f'Database error: {e.msg}.'
             exc = sys.exc_info()
@@ -209,6 +1262,9 @@ class Downloader:
             failed = True
 
         finally:
+            if response is not None:
+                # Return the connection to the pool
+                response.close()
             if progress_bar is not None:
                 progress_bar.close()
             if failed:
@@ -217,7 +1273,7 @@ class Downloader:
                 self.logger.error(failed_message)
                 download.status = Download.DownloadStatus.FAILED
                 download.failed_reason = failed_message
-                self.session.commit()
+                session.commit()
 
     def enqueue(self, session: Session, obj, download_url_field: str):
         download = Download.create_from_obj(obj, download_url_field)
@@ -229,11 +1285,83 @@ class Downloader:
         self.logger.debug(f"Enqueued download: "
                           f"Object type: {obj.__item_name__}, ID: {obj.id}, url_field: {download_url_field}.")
 
-        with self.__download_pushed_condition:
-            self.__download_pushed_condition.notify_all()
-            self.logger.debug(f"Download queue condition notified")
+        entry = QueuedDownload.of(download, obj)
+        Downloader.__after_commit(session, lambda: self.__queue(entry))
 
         return download
 
+    def pause(self, session: Session, download: Download) -> bool:
+        """
+        Pauses a queued or running download. A running download stops after the chunk it is currently writing and
+        keeps its partial file so it can be resumed.
+        :return: True if the download will be paused, False if it is not queued or running.
+        """
+        return self.__stop(session, download, Download.DownloadStatus.PAUSED, [Download.DownloadStatus.QUEUED])
+
+    def cancel(self, session: Session, download: Download) -> bool:
+        """
+        Cancels a queued, paused or running download. A running download stops after the chunk it is currently
+        writing.
+        :return: True if the download will be cancelled, False if it has already finished.
+        """
+        return self.__stop(session, download, Download.DownloadStatus.CANCELLED,
+                           [Download.DownloadStatus.QUEUED, Download.DownloadStatus.PAUSED])
+
+    def __stop(self, session: Session, download: Download, status: Download.DownloadStatus,
+               waiting_statuses: list[Download.DownloadStatus]) -> bool:
+        # Only change a waiting download if a worker has not claimed it in the meantime
+        result = session.execute(
+            update(Download)
+            .where(Download.id == download.id, or_(*[Download.status == s for s in waiting_statuses]))
+            .values(status=status)
+        )
+        if result.rowcount == 1:
+            download_id = download.id
+            Downloader.__after_commit(session, lambda: self.__update_queue(lambda queue: queue.remove(download_id)))
+            return True
+
+        session.refresh(download)
+        if download.status == Download.DownloadStatus.IN_PROGRESS:
+            with self.__download_pushed_condition:
+                if download.id in self.__small_recording:
+                    return False
+                self.__stop_requests[download.id] = status
+            return True
+        return False
+
+    def resume(self, session: Session, download: Download) -> bool:
+        """
+        Queues a paused download again. The download continues from the last recorded chunk.
+        :return: True if the download was queued, False if it is not paused.
+        """
+        result = session.execute(
+            update(Download)
+            .where(Download.id == download.id, Download.status == Download.DownloadStatus.PAUSED)
+            .values(status=Download.DownloadStatus.QUEUED)
+        )
+        if result.rowcount == 0:
+            return False
+
+        entity_type = database.get_entity_class_by_item_name(download.obj_item_name)
+        entry = QueuedDownload.of(download, session.get(entity_type, download.obj_id))
+        Downloader.__after_commit(session, lambda: self.__queue(entry))
+        return True
+
+    def reprioritize(self, session: Session, download: Download, priority: int) -> bool:
+        """
+        Changes the priority of a queued or paused download. Downloads with a lower priority are started first when
+        the priority scheduler is in use.
+        :return: True if the priority was changed, False if the download is running or has finished.
+        """
+        if download.status not in (Download.DownloadStatus.QUEUED, Download.DownloadStatus.PAUSED):
+            return False
+
+        download.priority = priority
+        download_id = download.id
+        Downloader.__after_commit(
+            session, lambda: self.__update_queue(lambda queue: queue.reprioritize(download_id, priority))
+        )
+        return True
+
 
 downloader = Downloader()
@@ -0,0 +1,122 @@
+import hashlib
+import logging
+import os
+from pathlib import Path
+from typing import Optional
+
+from config import config
+from server.database import File
+
+
+class FileStore:
+    """
+    Content-addressed storage for downloaded files. Each distinct file is kept once as a blob under
+    ``FILE_ROOT/objects``, named by the hash of its content, and the per-object paths of files are hard links to their
+    blob. Downloads of content that is already stored only cost a link.
+
+    Where hard links are not supported every file keeps its own copy, as it did before the store existed.
+    """
+    hash_name = 'sha256'
+    read_size = 1024 * 1024  # 1 MB
+
+    def __init__(self):
+        self.logger = logging.getLogger('gbmm').getChild('file-store')
+
+    @staticmethod
+    def object_path(content_hash: str) -> str:
+        return os.path.join(config.FILE_ROOT, 'objects', content_hash[:2], content_hash)
+
+    @staticmethod
+    def hasher(path: Optional[str] = None, length: int = 0):
+        """
+        Returns a new content hash. If a path is given, the first ``length`` bytes of that file are hashed first, so a
+        resumed download can hash the rest as it streams.
+        """
+        content_hash = hashlib.new(FileStore.hash_name)
+        if path is None or length <= 0:
+            return content_hash
+
+        remaining = length
+        view = memoryview(bytearray(FileStore.read_size))
+        with open(path, 'rb') as handle:
+            while remaining > 0:
+                read = handle.readinto(view[:min(remaining, len(view))])
+                if not read:
+                    break
+                content_hash.update(view[:read])
+                remaining -= read
+        return content_hash
+
+    @staticmethod
+    def release(path: str):
+        """
+        Unlinks a per-object path that is shared with a blob, so a new download written to the path never changes the
+        content of other files.
+        """
+        try:
+            if os.stat(path).st_nlink > 1:
+                os.unlink(path)
+        except FileNotFoundError:
+            pass
+
+    def add(self, file: File, content_hash: str):
+        """
+        Records the hash of a downloaded file and stores its content. If the content is already stored the downloaded
+        copy is replaced with a link to the stored blob.
+        """
+        file.content_hash = content_hash
+        blob_path = FileStore.object_path(content_hash)
+        Path(blob_path).parent.mkdir(parents=True, exist_ok=True)
+        try:
+            if os.path.exists(blob_path):
+                if not os.path.samefile(blob_path, file.path):
+                    FileStore.__replace_with_link(blob_path, file.path)
+                    self.logger.info(f'Stored {file.path} as a link to existing content {content_hash}.')
+            else:
+                os.link(file.path, blob_path)
+        except OSError as e:
+            self.logger.warning(f'Could not link {file.path} into the file store. Keeping its own copy. {e}')
+        FileStore.__record_stat(file)
+
+    def link(self, file: File, source: File) -> bool:
+        """
+        Links a file to the stored content of another file, so it does not have to be downloaded again.
+        :return: False if the content of the source file is not in the store or cannot be linked.
+        """
+        if source.content_hash is None:
+            return False
+        blob_path = FileStore.object_path(source.content_hash)
+        if not os.path.exists(blob_path):
+            return False
+        try:
+            Path(file.path).parent.absolute().mkdir(parents=True, exist_ok=True)
+            FileStore.__replace_with_link(blob_path, file.path)
+        except OSError as e:
+            self.logger.warning(f'Could not link {file.path} to stored content {source.content_hash}. {e}')
+            return False
+
+        file.content_hash = source.content_hash
+        file.content_type = source.content_type
+        FileStore.__record_stat(file)
+        return True
+
+    @staticmethod
+    def __record_stat(file: File):
+        stat = os.stat(file.path)
+        file.size_bytes = stat.st_size
+        file.hashed_mtime = stat.st_mtime
+
+    @staticmethod
+    def __replace_with_link(blob_path: str, path: str):
+        # Renaming over another link to the same blob would do nothing and leave the new link behind
+        if os.path.exists(path) and os.path.samefile(blob_path, path):
+            return
+        # Link beside the destination first, so the path is never missing or half written
+        link_path = f'{path}.link'
+        if os.path.lexists(link_path):
+            os.unlink(link_path)
+        os.link(blob_path, link_path)
+        os.replace(link_path, path)
+
+
+file_store = FileStore()
@@ -0,0 +1,182 @@
+import hashlib
+import logging
+import mmap
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Optional
+
+from sqlalchemy import select
+
+from server.database import Session, File, Download
+from server.db_writer import db_writer
+from server.file_store import FileStore, file_store
+
+
+def hash_path(path: str) -> Optional[str]:
+    """
+    Hashes a file through a memory map, so it is read straight from the page cache without copying it into the
+    process. hashlib releases the GIL while it hashes the map, so files are hashed in parallel on threads.
+    :return: The content hash, or None if the file cannot be read.
+    """
+    try:
+        with open(path, 'rb') as handle:
+            content_hash = hashlib.new(FileStore.hash_name)
+            if os.fstat(handle.fileno()).st_size > 0:
+                with mmap.mmap(handle.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    if hasattr(mapped, 'madvise'):
+                        mapped.madvise(mmap.MADV_SEQUENTIAL)
+                    content_hash.update(mapped)
+            return content_hash.hexdigest()
+    except (OSError, ValueError):
+        return None
+
+
+class FileVerifier:
+    """
+    Rechecks downloaded files against their content hashes and reports files that are missing or corrupted. Files are
+    hashed on a pool of threads. Files whose size and modification time have not changed since they were last hashed
+    are skipped, and files that are links to the same content are hashed once.
+
+    Files downloaded before content hashes were recorded are hashed and added to the file store.
+    """
+    threads = os.cpu_count() or 1
+    '''Number of hashing threads.'''
+
+    def __init__(self):
+        self.logger = logging.getLogger('gbmm').getChild('file-verifier')
+        self.__lock = threading.Lock()
+        self.__thread: Optional[threading.Thread] = None
+        self.__report: Optional[dict] = None
+
+    def start(self, full: bool = False) -> bool:
+        """
+        Starts verifying the library in the background.
+        :param full: Hash every file, including files that have not changed since they were last hashed.
+        :return: False if a verify pass is already running.
+        """
+        with self.__lock:
+            if self.__thread is not None and self.__thread.is_alive():
+                return False
+            self.__thread = threading.Thread(target=self.__run, args=(full,), daemon=True)
+            self.__thread.start()
+            return True
+
+    def __run(self, full: bool):
+        try:
+            self.verify(full)
+        except Exception:
+            self.logger.exception('Unhandled error verifying files.')
+
+    def verify(self, full: bool = False) -> dict:
+        """
+        Verifies every file in the library.
+        :param full: Hash every file, including files that have not changed since they were last hashed.
+        :return: A report of the files checked, and of the files that are missing or corrupted.
+        """
+        start = time.monotonic()
+        report = {
+            'started_time': datetime.now().isoformat(),
+            'finished_time': None,
+            'files': 0,
+            'skipped': 0,
+            'verified': 0,
+            'hashed': 0,
+            'missing': [],
+            'corrupted': []
+        }
+        self.logger.info('Verifying files.')
+
+        with Session() as session:
+            # Files of downloads that are still running, paused or failed are expected to be incomplete
+            files = session.execute(
+                select(File).where(
+                    File.path.is_not(None),
+                    File.downloads.any(Download.status == Download.DownloadStatus.COMPLETE)
+                )
+            ).scalars().all()
+            report['files'] = len(files)
+
+            # Files that are links to the same content only need to be read once
+            pending: dict[tuple[int, int], list[File]] = {}
+            mtimes: dict[tuple[int, int], float] = {}
+            for file in files:
+                try:
+                    stat = os.stat(file.path)
+                except FileNotFoundError:
+                    report['missing'].append({'id': file.id, 'path': file.path})
+                    continue
+
+                if file.size_bytes is not None and stat.st_size != file.size_bytes:
+                    report['corrupted'].append({
+                        'id': file.id,
+                        'path': file.path,
+                        'reason': f'Size is {stat.st_size}B, expected {file.size_bytes}B.'
+                    })
+                    continue
+
+                if not full and file.content_hash is not None and file.hashed_mtime == stat.st_mtime:
+                    report['skipped'] += 1
+                    continue
+
+                key = (stat.st_dev, stat.st_ino)
+                pending.setdefault(key, []).append(file)
+                mtimes[key] = stat.st_mtime
+
+            paths = [group[0].path for group in pending.values()]
+            # Threads rather than processes. Forking the server while its other threads hold locks can hang the child.
+            with ThreadPoolExecutor(max_workers=FileVerifier.threads) as executor:
+                hashes = list(executor.map(hash_path, paths))
+
+            updated: list[File] = []
+            for (key, group), content_hash in zip(pending.items(), hashes):
+                for file in group:
+                    if content_hash is None:
+                        report['corrupted'].append({'id': file.id, 'path': file.path, 'reason': 'Unreadable.'})
+                    elif file.content_hash is None:
+                        file_store.add(file, content_hash)
+                        updated.append(file)
+                        report['hashed'] += 1
+                    elif file.content_hash != content_hash:
+                        report['corrupted'].append({
+                            'id': file.id,
+                            'path': file.path,
+                            'reason': f'Content hash is {content_hash}, expected {file.content_hash}.'
+                        })
+                    else:
+                        file.hashed_mtime = mtimes[key]
+                        updated.append(file)
+                        report['verified'] += 1
+
+            # The read session is discarded. The new hashes and times are written by the database writer.
+            mappings = [
+                {
+                    'id': file.id,
+                    'content_hash': file.content_hash,
+                    'size_bytes': file.size_bytes,
+                    'hashed_mtime': file.hashed_mtime
+                }
+                for file in updated
+            ]
+        if len(mappings) > 0:
+            db_writer.write(lambda write_session: write_session.bulk_update_mappings(File, mappings))
+
+        report['finished_time'] = datetime.now().isoformat()
+        self.logger.info(
+            f'Verified {report["files"]} files in {time.monotonic() - start:.2f}s. {report["skipped"]} unchanged, '
+            f'{len(report["missing"])} missing, {len(report["corrupted"])} corrupted.')
+        with self.__lock:
+            self.__report = report
+        return report
+
+    def dump(self):
+        with self.__lock:
+            return {
+                'running': self.__thread is not None and self.__thread.is_alive(),
+                'report': self.__report
+            }
+
+
+file_verifier = FileVerifier()
@@ -1,8 +1,9 @@
 from typing import Optional, Type
 
 from config import config
+from server import api_format
 from server.database import GBEntity
-from server.requester import requester
+from server.requester import requester, RequestPriority
 from server.gb_api.response_metadata import ResponseMetadata
 
 from .resource_filter import ResourceFilterList
@@ -51,6 +52,8 @@ class Resource:
         '''The working metadata used to craft new requests.'''
         self.results = None
         '''The results portion of the response from a request.'''
+        self.priority: RequestPriority = RequestPriority.INTERACTIVE
+        '''The priority used for requests made by this Resource when none is given to the request.'''
         self.__override_url = None
         '''When set, requests are forced to this URL regardless of this Resource's other state.'''
 
@@ -76,17 +79,20 @@ class Resource:
         self.url = f'{self.__get_full_path()}{guid}/?{self.__build_filter_string()}{self.__build_api_key_string()}'
 
     def __build_overridden_url(self):
-        self.url = self.__override_url + '/?' + self.__build_api_key_string()
+        self.url = f'{self.__override_url}/?format={config.API_FORMAT}&{self.__build_api_key_string()}'
 
-    def _request(self, guid: str = None):
+    def _request(self, guid: str = None, priority: RequestPriority = None):
+        self.filters.set('format', config.API_FORMAT)
         if self.__override_url is not None:
             self.__build_overridden_url()
         else:
             self.__build_url(guid)
-        self.response = requester.request(self.url)
+        if priority is None:
+            priority = self.priority
+        self.response = requester.request(self.url, priority)
         self.last_response_metadata = ResponseMetadata(self.response)
         self.working_metadata = ResponseMetadata(self.response)
-        self.results = self.response.results
+        self.results = api_format.get_node(self.response, 'results')
 
     def override_url(self, url: str):
         """
@@ -100,17 +106,20 @@ class Resource:
 
 
 class SingleResultResource(Resource):
-    def get(self, *, id: int = None, guid: str = None):
+    def get(self, *, id: int = None, guid: str = None, priority: RequestPriority = None):
         """
         Gets the result for this resource. Optionally, supply the id or guid to set for this resource before
         sending the request. If an override URL is set for this resource, the id and guid are ignored.
         :param id: The ID of the result to get.
         :param guid: The GUID of the result to get.
+        :param priority: The priority of the request. Defaults to this resource's priority.
         :return:
         """
         if id is not None:
             guid = self.result_entity_type.id_to_guid(id)
-        self._request(guid)
+        self._request(guid, priority)
+        if api_format.is_empty(self.results):
+            return None
         return self.results
 
 
@@ -238,4 +247,4 @@ class MultipleResultResource(Resource):
         else:
             limit = 0
         self.filters.set('offset', offset + limit)
-        return [c for c in self.results.iterchildren()]
+        return api_format.children(self.results)
@@ -1,16 +1,18 @@
 from marshmallow import Schema, fields, post_load
 
+from server import api_format
+
 
 class ResponseMetadata:
     def __init__(self, response=None):
         if response is not None:
-            self.error = str(response.error)
-            self.limit = int(response.limit)
-            self.offset = int(response.offset)
-            self.number_of_page_results = int(response.number_of_page_results)
-            self.number_of_total_results = int(response.number_of_total_results)
-            self.status_code = int(response.status_code)
-            self.version = str(response.version)
+            self.error = str(api_format.get_value(response, 'error'))
+            self.limit = int(api_format.get_value(response, 'limit'))
+            self.offset = int(api_format.get_value(response, 'offset'))
+            self.number_of_page_results = int(api_format.get_value(response, 'number_of_page_results'))
+            self.number_of_total_results = int(api_format.get_value(response, 'number_of_total_results'))
+            self.status_code = int(api_format.get_value(response, 'status_code'))
+            self.version = str(api_format.get_value(response, 'version'))
 
 
 class ResponseMetadataSchema(Schema):
@@ -0,0 +1,70 @@
+import threading
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from config import config
+
+
+class HttpPool:
+    """
+    Pooled HTTP sessions shared by the requester and downloader daemons. Each host gets its own session so
+    connections are kept alive and reused between requests instead of paying for a new TLS handshake every time.
+    """
+    host_pools = 10
+    '''The number of connection pools each session keeps, one per host it has redirected to.'''
+
+    def __init__(self):
+        self.__sessions: dict[str, requests.Session] = {}
+        self.__lock = threading.Lock()
+
+    @staticmethod
+    def __new_session() -> requests.Session:
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HttpPool.host_pools, pool_maxsize=config.HTTP_POOL_SIZE)
+        session.mount('https://', adapter)
+        session.mount('http://', adapter)
+        if not config.HTTP_KEEP_ALIVE:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def session(self, url: str) -> requests.Session:
+        """Returns the session for the host of the given URL, creating it if needed."""
+        host = urlsplit(url).netloc
+        with self.__lock:
+            session = self.__sessions.get(host)
+            if session is None:
+                session = self.__new_session()
+                self.__sessions[host] = session
+            return session
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Sends a GET request through the session for the URL's host. Accepts the same arguments as requests.get."""
+        kwargs.setdefault('timeout', (config.HTTP_CONNECT_TIMEOUT, config.HTTP_READ_TIMEOUT))
+        return self.session(url).get(url, **kwargs)
+
+    def dump(self):
+        with self.__lock:
+            sessions = dict(self.__sessions)
+
+        hosts = {}
+        for host, session in sessions.items():
+            opened = 0
+            sent = 0
+            for adapter in set(session.adapters.values()):
+                pools = adapter.poolmanager.pools
+                for key in pools.keys():
+                    pool = pools.get(key)
+                    if pool is not None:
+                        opened += pool.num_connections
+                        sent += pool.num_requests
+            hosts[host] = {
+                'connections_opened': opened,
+                'connections_reused': max(sent - opened, 0),
+                'requests': sent
+            }
+        return hosts
+
+
+http_pool = HttpPool()
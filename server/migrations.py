@@ -0,0 +1,283 @@
+import logging
+from contextlib import contextmanager
+from typing import Callable
+
+from sqlalchemy import select, insert, update, delete, inspect, text, func
+from sqlalchemy.engine import Connection
+
+from server.database import engine, DatabaseError, Base, Setting, Image, Download, DownloadCount, Video, File, \
+    operational_database, database_tables
+
+version_setting_key = 'gbmm_db_version'
+'''Key of the Setting that records the version of the database schema.'''
+base_version = '1.0'
+'''The version of databases created before migrations existed.'''
+
+
+class Migration:
+    def __init__(self, version: str, description: str, upgrade: Callable[[Connection], None]):
+        self.version = version
+        '''The database version after this migration has been applied.'''
+        self.description = description
+        self.upgrade = upgrade
+        '''
+        Upgrades a database from the previous version. Called in a transaction. Must be safe to run against a
+        database that already has the change, since new databases are created with the latest schema.
+        '''
+
+
+@contextmanager
+def ddl_transaction(connection: Connection):
+    """
+    Runs a transaction that includes schema changes. pysqlite only begins transactions before data changes, so DDL
+    would otherwise be committed as soon as it ran and survive a failed migration. Here the transaction begins with an
+    explicit BEGIN.
+    """
+    dbapi_connection = connection.connection.dbapi_connection
+    isolation_level = dbapi_connection.isolation_level
+    dbapi_connection.isolation_level = None
+    try:
+        with connection.begin():
+            connection.exec_driver_sql('BEGIN')
+            yield
+    finally:
+        dbapi_connection.isolation_level = isolation_level
+
+
+def version_tuple(version: str) -> tuple[int, ...]:
+    return tuple(int(part) for part in version.split('.'))
+
+
+def table_schema(connection: Connection, table_name: str) -> str:
+    """
+    Returns the schema of the database file a table is in. Migrations run on connections to the catalog database, and
+    tables that have been moved to the operational database are only found there.
+    """
+    return 'main' if inspect(connection).has_table(table_name) else operational_database
+
+
+def add_missing_columns(connection: Connection, entity_type, *column_names: str):
+    """Adds columns of a model to its table if the table was created before they existed."""
+    table = entity_type.__table__
+    schema = table_schema(connection, table.name)
+    existing = [c['name'] for c in inspect(connection).get_columns(table.name, schema=schema)]
+    for name in column_names:
+        if name in existing:
+            continue
+        column = table.c[name]
+        column_type = column.type.compile(dialect=connection.dialect)
+        connection.execute(text(f'ALTER TABLE {schema}.{table.name} ADD COLUMN {column.name} {column_type}'))
+
+
+def add_missing_indexes(connection: Connection, entity_type):
+    """Creates the indexes of a model if its table was created before they existed."""
+    table = entity_type.__table__
+    schema = table_schema(connection, table.name)
+    existing = [i['name'] for i in inspect(connection).get_indexes(table.name, schema=schema)]
+    for index in table.indexes:
+        if index.name in existing:
+            continue
+        unique = 'UNIQUE ' if index.unique else ''
+        columns = ', '.join(c.name for c in index.columns)
+        connection.execute(text(f'CREATE {unique}INDEX {schema}.{index.name} ON {table.name} ({columns})'))
+
+
+# region Migrations
+
+def image_url_hash(connection: Connection):
+    """
+    Adds the url_hash column to an image table created before it existed. Existing rows are backfilled, and
+    duplicate images are merged into the oldest row before the unique index is created. The index is created last, so
+    its presence marks a finished migration.
+    """
+    if 'ix_image_url_hash' in [i['name'] for i in inspect(connection).get_indexes(Image.__tablename__)]:
+        return
+
+    add_missing_columns(connection, Image, 'url_hash')
+
+    image_references = [
+        (fk.parent.table.name, fk.parent.name)
+        for table in Base.metadata.tables.values()
+        for fk in table.foreign_keys
+        if fk.column.table.name == Image.__tablename__
+    ]
+
+    kept: dict[str, int] = {}
+    rows = connection.execute(
+        select(Image.__table__.c.id, *[Image.__table__.c[f] for f in Image.url_fields])
+        .order_by(Image.__table__.c.id.asc())
+    ).mappings().all()
+    for row in rows:
+        url_hash = Image.compute_url_hash(dict(row))
+        kept_id = kept.get(url_hash)
+        if kept_id is None:
+            kept[url_hash] = row['id']
+            connection.execute(
+                text('UPDATE image SET url_hash = :url_hash WHERE id = :id'),
+                {'url_hash': url_hash, 'id': row['id']}
+            )
+        else:
+            for table_name, column_name in image_references:
+                connection.execute(
+                    text(f'UPDATE {table_name} SET {column_name} = :kept_id WHERE {column_name} = :id'),
+                    {'kept_id': kept_id, 'id': row['id']}
+                )
+            connection.execute(text('DELETE FROM image WHERE id = :id'), {'id': row['id']})
+
+    connection.execute(text('CREATE UNIQUE INDEX IF NOT EXISTS ix_image_url_hash ON image (url_hash)'))
+
+
+def hot_path_indexes(connection: Connection):
+    """
+    Creates composite indexes for the download queue, download lookups by object and the video listings by show,
+    category and publish date.
+    """
+    for entity_type in (Download, Video):
+        add_missing_indexes(connection, entity_type)
+
+
+def download_segments(connection: Connection):
+    """Adds the column that records the progress of each segment of a segmented download."""
+    add_missing_columns(connection, Download, 'segments')
+
+
+def download_priority(connection: Connection):
+    """Adds the priority of queued downloads. Existing downloads get the default priority."""
+    add_missing_columns(connection, Download, 'priority')
+    connection.execute(update(Download.__table__).where(Download.__table__.c.priority.is_(None)).values(priority=0))
+
+
+def file_content_hash(connection: Connection):
+    """
+    Adds the URL and content hash of files for the file store. Existing files get the URL of their latest download.
+    Their content is not hashed, so they are not shared with new downloads.
+    """
+    add_missing_columns(connection, File, 'url', 'content_hash')
+    file = File.__table__
+    download = Download.__table__
+    latest_url = (
+        select(download.c.url)
+        .where(download.c.file_id == file.c.id)
+        .order_by(download.c.id.desc())
+        .limit(1)
+        .scalar_subquery()
+    )
+    connection.execute(update(file).where(file.c.url.is_(None)).values(url=latest_url))
+    add_missing_indexes(connection, File)
+
+
+def file_hashed_mtime(connection: Connection):
+    """Adds the modification time of files when they were hashed, so verifying the library can skip them."""
+    add_missing_columns(connection, File, 'hashed_mtime')
+
+
+def operational_database_copy(connection: Connection):
+    """
+    Copies the download queue, download history, files and settings from the catalog database into the operational
+    database, which was created empty alongside it. Rows that are already there are kept, so an interrupted copy can
+    be run again. The catalog keeps its tables until the next migration, because a transaction across two files is not
+    atomic in WAL mode.
+    """
+    for table in database_tables(operational_database):
+        if not inspect(connection).has_table(table.name):
+            continue
+        legacy_columns = [c['name'] for c in inspect(connection).get_columns(table.name, schema='main')]
+        columns = ', '.join(c.name for c in table.columns if c.name in legacy_columns)
+        connection.execute(text(
+            f'INSERT OR IGNORE INTO {operational_database}.{table.name} ({columns}) '
+            f'SELECT {columns} FROM main.{table.name}'
+        ))
+
+
+def operational_database_drop(connection: Connection):
+    """
+    Drops the tables copied to the operational database from the catalog database, once every row is known to be in
+    the copy. Stops the upgrade without dropping anything if rows are missing.
+    """
+    for table in database_tables(operational_database):
+        if not inspect(connection).has_table(table.name):
+            continue
+        legacy_count = connection.execute(text(f'SELECT count(*) FROM main.{table.name}')).scalar()
+        copied_count = connection.execute(text(
+            f'SELECT count(*) FROM {operational_database}.{table.name} '
+            f'WHERE id IN (SELECT id FROM main.{table.name})'
+        )).scalar()
+        if copied_count != legacy_count:
+            raise DatabaseError(f'Only {copied_count} of {legacy_count} rows of table {table.name} were copied to the '
+                                f'operational database. Keeping the original table.')
+        connection.execute(text(f'DROP TABLE main.{table.name}'))
+
+
+def download_counts(connection: Connection):
+    """
+    Adds the index the download history is paged by, and counts existing downloads by status. Triggers keep the counts
+    up to date from then on.
+    """
+    add_missing_indexes(connection, Download)
+    for statement in DownloadCount.triggers(table_schema(connection, Download.__tablename__)):
+        connection.execute(text(statement))
+
+    download = Download.__table__
+    download_count = DownloadCount.__table__
+    connection.execute(delete(download_count))
+    connection.execute(insert(download_count).from_select(
+        ['status', 'count'],
+        select(download.c.status, func.count()).where(download.c.status.is_not(None)).group_by(download.c.status)
+    ))
+
+# endregion Migrations
+
+
+migrations = [
+    Migration('1.1', 'Identify images by a hash of their URLs.', image_url_hash),
+    Migration('1.2', 'Add indexes for the download queue and video listings.', hot_path_indexes),
+    Migration('1.3', 'Record the segments of segmented downloads.', download_segments),
+    Migration('1.4', 'Add download priorities.', download_priority),
+    Migration('1.5', 'Add the file store.', file_content_hash),
+    Migration('1.6', 'Record when files were hashed.', file_hashed_mtime),
+    Migration('1.7', 'Copy downloads, files and settings to the operational database.', operational_database_copy),
+    Migration('1.8', 'Remove the copied tables from the catalog database.', operational_database_drop),
+    Migration('1.9', 'Count downloads by status and page the download history by finish time.', download_counts)
+]
+
+latest_version = migrations[-1].version
+
+
+def get_version(connection: Connection) -> str:
+    setting = Setting.__table__
+    version = connection.execute(
+        select(setting.c.value).where(setting.c.key == version_setting_key)
+    ).scalar()
+    return version if version is not None else base_version
+
+
+def set_version(connection: Connection, version: str):
+    setting = Setting.__table__
+    result = connection.execute(
+        update(setting).where(setting.c.key == version_setting_key).values(value=version)
+    )
+    if result.rowcount == 0:
+        connection.execute(insert(setting).values(key=version_setting_key, value=version, type='str'))
+
+
+def upgrade():
+    """
+    Upgrades the database in place to the latest version. Each pending migration is applied in its own transaction
+    along with the version it brings the database to.
+    """
+    logger = logging.getLogger('gbmm').getChild('migrations')
+    with engine.connect() as connection:
+        current_version = get_version(connection)
+
+    logger.info(f'Database version {current_version}.')
+    for migration in migrations:
+        if version_tuple(migration.version) <= version_tuple(current_version):
+            continue
+        logger.info(f'Upgrading database to version {migration.version}: {migration.description}')
+        with engine.connect() as connection:
+            with ddl_transaction(connection):
+                migration.upgrade(connection)
+                set_version(connection, migration.version)
+            # Write the migration from the WAL of each file to the file itself before the next one builds on it
+            connection.exec_driver_sql('PRAGMA wal_checkpoint(FULL)')
+        current_version = migration.version
@@ -0,0 +1,113 @@
+import threading
+import time
+from array import array
+from typing import Optional
+
+
+class DownloadProgress:
+    """
+    Live progress of a running download. A ring of recent samples of the downloaded byte count and the time it was
+    reached is used to work out the transfer rate over the last few seconds.
+    """
+    ring_size = 64
+    sample_interval = 0.5
+    '''Minimum number of seconds between samples, so the ring covers about half a minute.'''
+
+    def __init__(self, download_id: int, size_bytes: int, downloaded_bytes: int):
+        self.download_id = download_id
+        self.size_bytes = size_bytes
+        self.downloaded_bytes = downloaded_bytes
+        self.flushed_time = time.monotonic()
+        '''When downloaded_bytes was last written to the database.'''
+        self.__sample_bytes = array('q', [0] * DownloadProgress.ring_size)
+        self.__sample_times = array('d', [0.0] * DownloadProgress.ring_size)
+        self.__next = 0
+        self.__count = 0
+        self.__sample(self.flushed_time)
+
+    def __sample(self, now: float):
+        self.__sample_bytes[self.__next] = self.downloaded_bytes
+        self.__sample_times[self.__next] = now
+        self.__next = (self.__next + 1) % DownloadProgress.ring_size
+        self.__count = min(self.__count + 1, DownloadProgress.ring_size)
+
+    def add(self, byte_count: int):
+        self.downloaded_bytes += byte_count
+        now = time.monotonic()
+        newest = (self.__next - 1) % DownloadProgress.ring_size
+        if now - self.__sample_times[newest] >= DownloadProgress.sample_interval:
+            self.__sample(now)
+
+    @property
+    def rate(self) -> float:
+        """Bytes per second over the samples in the ring."""
+        oldest = (self.__next - self.__count) % DownloadProgress.ring_size
+        elapsed = time.monotonic() - self.__sample_times[oldest]
+        if elapsed <= 0:
+            return 0.0
+        return (self.downloaded_bytes - self.__sample_bytes[oldest]) / elapsed
+
+    @property
+    def eta(self) -> Optional[float]:
+        """Seconds until the download completes at the current rate, or None if it cannot be estimated."""
+        rate = self.rate
+        if not self.size_bytes or rate <= 0:
+            return None
+        return max(self.size_bytes - self.downloaded_bytes, 0) / rate
+
+    def flush_due(self, interval: float) -> bool:
+        """Returns True, and restarts the interval, if downloaded_bytes should be written to the database."""
+        now = time.monotonic()
+        if now - self.flushed_time < interval:
+            return False
+        self.flushed_time = now
+        return True
+
+    def dump(self):
+        return {
+            'id': self.download_id,
+            'size_bytes': self.size_bytes,
+            'downloaded_bytes': self.downloaded_bytes,
+            'rate_bytes': self.rate,
+            'eta_seconds': self.eta
+        }
+
+
+class ProgressTracker:
+    """
+    Registry of the progress of running downloads. The downloader updates it for every chunk and only writes progress to
+    the database every few seconds, so the API reads live progress from here.
+    """
+    def __init__(self):
+        self.__lock = threading.Lock()
+        self.__downloads: dict[int, DownloadProgress] = {}
+
+    def start(self, download_id: int, size_bytes: int, downloaded_bytes: int) -> DownloadProgress:
+        progress = DownloadProgress(download_id, size_bytes, downloaded_bytes)
+        with self.__lock:
+            self.__downloads[download_id] = progress
+        return progress
+
+    def add(self, download_id: int, byte_count: int):
+        """Records bytes written for a download. Safe to call from several threads for the same download."""
+        with self.__lock:
+            progress = self.__downloads.get(download_id)
+            if progress is not None:
+                progress.add(byte_count)
+
+    def stop(self, download_id: int):
+        with self.__lock:
+            self.__downloads.pop(download_id, None)
+
+    def get(self, download_id: int) -> Optional[dict]:
+        """Returns the live progress of a download, or None if it is not running."""
+        with self.__lock:
+            progress = self.__downloads.get(download_id)
+            return progress.dump() if progress is not None else None
+
+    def dump(self) -> list[dict]:
+        with self.__lock:
+            return [progress.dump() for progress in self.__downloads.values()]
+
+
+progress_tracker = ProgressTracker()
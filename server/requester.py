@@ -1,93 +1,291 @@
 from config import config
+import heapq
+import itertools
 import time
 import threading
-import requests
+from enum import IntEnum
 import logging
-from lxml import objectify
+
+from server import api_format
+from server.http_pool import http_pool
+from server.response_cache import response_cache
+
+
+class RequestPriority(IntEnum):
+    """Priority classes for API requests. Requests with a lower value are sent first."""
+    INTERACTIVE = 10
+    '''A user is waiting on the result, e.g. browsing videos.'''
+    ENQUEUE = 20
+    '''Resolving the object behind a newly enqueued download.'''
+    BACKGROUND = 30
+    '''Bulk synchronization of the catalog.'''
 
 
 class Request:
-    __next_request_id = 0
+    __request_ids = itertools.count()
     headers = config.HEADERS
 
-    def __init__(self, url):
+    def __init__(self, url, priority: RequestPriority = RequestPriority.INTERACTIVE):
         self.url = url
-        self.request_id = self.__get_request_id()
+        self.priority = priority
+        self.request_id = next(Request.__request_ids)
         self.condition = threading.Condition()
         self.created_time = time.time()
         self.enqueued_time = None
         self.requested_time = None
         self.response_time = None
         self.result = None
+        self.exception = None
+        '''Set when the request could not be completed.'''
+        self.complete = False
+        self.dispatched = False
+        '''Set when the request has been taken off the queue to be sent.'''
+        self.cache_key = response_cache.canonical_url(url)
+        self.response_format = api_format.format_of(url)
+
+
+class RequestQueue:
+    """
+    A priority queue of requests. Requests are ordered by priority class, then in the order they were pushed within
+    each class.
+    """
+    def __init__(self):
+        self.__heap: list[tuple[int, int, Request]] = []
+        self.__sequence = itertools.count()
+        self.__stale = 0
+        '''Number of heap entries left behind by reprioritized requests. These are skipped when popped.'''
+
+    def __len__(self):
+        return len(self.__heap) - self.__stale
+
+    def push(self, request: Request):
+        heapq.heappush(self.__heap, (request.priority, next(self.__sequence), request))
+
+    def reprioritize(self, request: Request, priority: RequestPriority):
+        """Moves a queued request to a higher priority class. Requests are never moved to a lower one."""
+        if priority >= request.priority:
+            return
+        request.priority = priority
+        self.__stale += 1
+        self.push(request)
 
-    def __get_request_id(self):
-        i = self.__next_request_id
-        self.__next_request_id += 1
-        return i
+    def pop(self) -> Request:
+        while True:
+            priority, _, request = heapq.heappop(self.__heap)
+            if priority == request.priority:
+                return request
+            self.__stale -= 1
+
+    def dump(self):
+        counts = {p.name: 0 for p in RequestPriority}
+        for priority, _, request in self.__heap:
+            if priority == request.priority:
+                counts[RequestPriority(priority).name] += 1
+        return counts
+
+
+class TokenBucket:
+    """
+    Paces API requests. The bucket holds up to ``capacity`` tokens and regains ``refill_rate`` tokens per second.
+    Each request spends one token, so short bursts go out immediately while the long-run rate stays at the refill rate.
+    """
+    def __init__(self, capacity: int, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+        self.tokens = float(capacity)
+        self.updated_time = time.monotonic()
+        self.__lock = threading.Lock()
+
+    def __refill(self):
+        now = time.monotonic()
+        self.tokens = min(float(self.capacity), self.tokens + (now - self.updated_time) * self.refill_rate)
+        self.updated_time = now
+
+    def configure(self, capacity: int, refill_rate: float):
+        """Updates the limits of the bucket. Tokens already in the bucket are kept up to the new capacity."""
+        with self.__lock:
+            self.__refill()
+            self.capacity = max(capacity, 1)
+            self.refill_rate = refill_rate
+            self.tokens = min(self.tokens, float(self.capacity))
+
+    def try_acquire(self) -> float:
+        """
+        Attempts to take a token from the bucket.
+        :return: 0 if a token was taken, otherwise the number of seconds until a token will be available.
+        """
+        with self.__lock:
+            self.__refill()
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0
+            if self.refill_rate <= 0:
+                return float('inf')
+            return (1 - self.tokens) / self.refill_rate
+
+    def acquire(self):
+        """Takes a token from the bucket, sleeping until one is available."""
+        while True:
+            wait_time = self.try_acquire()
+            if wait_time == 0:
+                return
+            time.sleep(min(wait_time, 60))
+
+    def drain(self):
+        """Empties the bucket. Used when the API reports that the rate limit has been exceeded."""
+        with self.__lock:
+            self.__refill()
+            self.tokens = 0
+            self.updated_time = time.monotonic()
+
+    def dump(self):
+        with self.__lock:
+            self.__refill()
+            return {
+                'capacity': self.capacity,
+                'refill_rate': self.refill_rate,
+                'tokens': self.tokens
+            }
 
 
 class Requester:
+    status_ok = 1
+    '''The status code the API responds with when a request succeeded.'''
+    status_rate_limit_exceeded = 107
+    '''The status code the API responds with when the rate limit has been exceeded.'''
+
     def __init__(self):
         self.logger = logging.getLogger('gbmm').getChild('requester')
-        self.__queue: [Request] = []
+        self.__queue = RequestQueue()
         self.__queue_lock = threading.Lock()
         self.__queue_pushed_condition = threading.Condition(self.__queue_lock)
+        self.__in_flight: dict[str, Request] = {}
+        '''Requests that are queued or being sent, by cache key. Identical requests attach to these.'''
+        self.coalesced = 0
+        '''Number of requests that were attached to an identical request instead of being sent.'''
+        self.bucket = TokenBucket(config.API_BURST_SIZE, config.API_REFILL_RATE)
+        '''Paces requests sent to the API. Limits are read from the api.rate limit configuration section.'''
         self.logger.debug('Starting requester daemon')
         self.__daemon = threading.Thread(target=self.__processor, daemon=True).start()
 
     def __processor(self):
         daemon_logger = self.logger.getChild('daemon')
         daemon_logger.debug('Requester daemon processor thread started')
-        min_sleep_time = 1.1
-        last_request_sent = 0
         while True:
-            self.__queue_lock.acquire()
-            if len(self.__queue):
-                r: Request = self.__queue.pop()
-                daemon_logger.debug(f'Processing request {r.request_id}. '
-                                    f'Was waiting in queue for {time.time() - r.enqueued_time} seconds.')
-                self.__queue_lock.release()
-
-                r.requested_time = time.time()
-                daemon_logger.debug(f'Sending request {r.request_id} to {r.url}')
-                last_request_sent = r.requested_time
-                xml = requests.get(r.url, headers=r.headers).text.encode('utf-8')
-                r.response_time = time.time()
-                daemon_logger.debug(f'Request {r.request_id} responded. '
-                                    f'Total response time {r.response_time - r.requested_time} seconds.')
-
-                parser = objectify.makeparser(encoding='utf-8')
-                r.result = objectify.fromstring(xml, parser)
-                with r.condition:
-                    r.condition.notify_all()
-
-            else:
-                self.__queue_lock.release()
-
-            sleep_time = max([min_sleep_time - (time.time() - last_request_sent), 0])
-            daemon_logger.debug(f'Requester daemon sleeping for {sleep_time} seconds')
-            time.sleep(sleep_time)
             with self.__queue_pushed_condition:
                 while len(self.__queue) == 0:
                     daemon_logger.debug(f"Requester daemon awaiting notification.")
                     self.__queue_pushed_condition.wait()
                     daemon_logger.debug(f"Requester daemon received notification.")
 
-    def request(self, url: str):
-        new_request = Request(url)
-        self.logger.debug(f"Created request {new_request.request_id}.")
+            # Wait for a token before taking a request off the queue so the request sent is the one most deserving
+            # of it at the time it is sent.
+            self.bucket.configure(config.API_BURST_SIZE, config.API_REFILL_RATE)
+            self.bucket.acquire()
+
+            with self.__queue_lock:
+                r: Request = self.__queue.pop()
+                r.dispatched = True
+            daemon_logger.debug(f'Processing request {r.request_id}. '
+                                f'Was waiting in queue for {time.time() - r.enqueued_time} seconds.')
+
+            try:
+                self.__send(r, daemon_logger)
+            except Exception as e:
+                daemon_logger.exception(f'Request {r.request_id} failed.')
+                r.exception = e
+
+            with self.__queue_lock:
+                if self.__in_flight.get(r.cache_key) is r:
+                    del self.__in_flight[r.cache_key]
+            with r.condition:
+                r.complete = True
+                r.condition.notify_all()
+
+    def __send(self, r: Request, daemon_logger: logging.Logger):
+        r.requested_time = time.time()
+        daemon_logger.debug(f'Sending request {r.request_id} to {r.url}')
+        response = http_pool.get(r.url, headers=r.headers)
+        if r.response_format == api_format.ResponseFormat.XML:
+            body = response.text.encode('utf-8')
+        else:
+            body = response.content
+        r.response_time = time.time()
+        daemon_logger.debug(f'Request {r.request_id} responded. '
+                            f'Total response time {r.response_time - r.requested_time} seconds.')
+
+        r.result = api_format.parse(body, r.response_format)
+        status_code = int(api_format.get_value(r.result, 'status_code', 0))
+        if status_code == Requester.status_ok:
+            if config.API_CACHE_ENABLED:
+                response_cache.put(r.cache_key, body)
+        elif status_code == Requester.status_rate_limit_exceeded:
+            daemon_logger.warning('The API reported that the rate limit has been exceeded. Draining the bucket.')
+            self.bucket.drain()
+
+    def __enqueue(self, new_request: Request) -> Request:
+        """
+        Enqueues a request, unless an identical request is already queued or being sent. In that case the new request
+        is attached to the existing one, which is moved up to the new request's priority if it has not been sent yet.
+        :return: The request whose result the caller should wait on.
+        """
         with self.__queue_lock:
-            self.__queue.append(new_request)
+            existing = self.__in_flight.get(new_request.cache_key)
+            if existing is not None:
+                self.coalesced += 1
+                if not existing.dispatched:
+                    self.__queue.reprioritize(existing, new_request.priority)
+                self.logger.debug(f"Request {new_request.request_id} attached to request {existing.request_id}.")
+                return existing
+
+            self.__in_flight[new_request.cache_key] = new_request
+            self.__queue.push(new_request)
             new_request.enqueued_time = time.time()
             self.logger.debug(f"Request {new_request.request_id} enqueued.")
             self.__queue_pushed_condition.notify_all()
             self.logger.debug(f"Request queue condition notified")
-        with new_request.condition:
-            while new_request.result is None:
-                self.logger.debug(f"Waiting for the condition for request {new_request.request_id} to be notified")
-                new_request.condition.wait()
+            return new_request
+
+    def request(self, url: str, priority: RequestPriority = RequestPriority.INTERACTIVE):
+        new_request = Request(url, priority)
+        self.logger.debug(f"Created request {new_request.request_id} with priority {priority.name}.")
 
-        return new_request.result
+        if config.API_CACHE_ENABLED:
+            cached = response_cache.get(new_request.cache_key)
+            if cached is not None and cached.fresh:
+                self.logger.debug(f"Request {new_request.request_id} served from the cache.")
+                return api_format.parse(cached.body, new_request.response_format)
+            if cached is not None and config.API_CACHE_STALE_WHILE_REVALIDATE:
+                # Serve the stale response now and refresh the cache in the background. Nothing waits on the refresh.
+                self.logger.debug(f"Request {new_request.request_id} served stale from the cache. Revalidating.")
+                new_request.priority = RequestPriority.BACKGROUND
+                self.__enqueue(new_request)
+                return api_format.parse(cached.body, new_request.response_format)
+
+        r = self.__enqueue(new_request)
+        with r.condition:
+            while not r.complete:
+                self.logger.debug(f"Waiting for the condition for request {r.request_id} to be notified")
+                r.condition.wait()
+
+        if r.exception is not None:
+            raise r.exception
+        return r.result
+
+    def dump(self):
+        with self.__queue_lock:
+            queue_length = len(self.__queue)
+            queue_priorities = self.__queue.dump()
+            in_flight = len(self.__in_flight)
+            coalesced = self.coalesced
+        return {
+            'queue_length': queue_length,
+            'queue_priorities': queue_priorities,
+            'in_flight': in_flight,
+            'coalesced': coalesced,
+            'bucket': self.bucket.dump(),
+            'cache': response_cache.dump()
+        }
 
 
 requester = Requester()
@@ -0,0 +1,197 @@
+import os
+import threading
+import time
+from pathlib import Path
+from typing import Optional
+from urllib.parse import urlsplit, urlunsplit, parse_qsl, urlencode
+
+from sqlalchemy import create_engine, Column, String, Integer, Float, LargeBinary, select, update, delete, func
+from sqlalchemy.orm import declarative_base, sessionmaker
+
+from config import config
+from server.sqlite_pragmas import apply_pragmas
+
+cache_path = os.path.join(config.DATABASE_DIR, config.DATABASE_CACHE_NAME)
+# Create the database directory if it does not exist
+Path(cache_path).parent.absolute().mkdir(parents=True, exist_ok=True)
+cache_url = f'sqlite+pysqlite:///{cache_path}'
+cache_engine = create_engine(cache_url, future=True)
+apply_pragmas(cache_engine)
+CacheSession = sessionmaker(cache_engine)
+CacheBase = declarative_base()
+
+
+class CachedResponse(CacheBase):
+    __tablename__ = 'response'
+    key = Column(String, primary_key=True)
+    '''Canonical URL of the request. See ResponseCache.canonical_url.'''
+    resource = Column(String)
+    '''Name of the API resource the response came from, e.g. videos.'''
+    body = Column(LargeBinary)
+    '''Raw response body.'''
+    size_bytes = Column(Integer)
+    stored_time = Column(Float)
+    expires_time = Column(Float)
+    last_access_time = Column(Float, index=True)
+    '''Used to evict the least recently used responses first.'''
+    hits = Column(Integer)
+
+
+class CacheEntry:
+    def __init__(self, body: bytes, fresh: bool):
+        self.body = body
+        self.fresh = fresh
+
+
+class ResponseCache:
+    """
+    Persistent cache of raw API responses, keyed by canonical URL. Entries expire after a per-resource TTL and the
+    least recently used entries are evicted when the cache grows past its configured bounds.
+    """
+    def __init__(self):
+        self.__stats_lock = threading.Lock()
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self.__accesses_lock = threading.Lock()
+        self.__accesses: dict[str, tuple[float, int]] = {}
+        '''Last access time and number of hits of each key since the accesses were last written to the cache.'''
+
+    @staticmethod
+    def canonical_url(url: str) -> str:
+        """
+        Builds the cache key for a URL: the API key is removed and the query parameters are sorted, so equivalent
+        requests share a key regardless of parameter order or whose key made them.
+        """
+        parts = urlsplit(url)
+        query = sorted(
+            (k, v) for k, v in parse_qsl(parts.query, keep_blank_values=True)
+            if k != config.API_KEY_FIELD
+        )
+        return urlunsplit((parts.scheme, parts.netloc, parts.path.rstrip('/'), urlencode(query), ''))
+
+    @staticmethod
+    def resource_name(key: str) -> str:
+        """Returns the name of the API resource a canonical URL points to, e.g. videos or video."""
+        base_path = urlsplit(config.API_BASE_URL).path
+        path = urlsplit(key).path
+        if path.startswith(base_path):
+            path = path[len(base_path):]
+        return path.strip('/').split('/')[0]
+
+    def __count(self, stat: str):
+        with self.__stats_lock:
+            setattr(self, stat, getattr(self, stat) + 1)
+
+    def get(self, key: str) -> Optional[CacheEntry]:
+        """
+        Looks up a response in the cache.
+        :param key: The canonical URL of the request.
+        :return: The cached entry, which may be stale, or None if the key is not cached.
+        """
+        now = time.time()
+        # Hits only read. Their accesses are written with the next store or eviction, so reads never take the lock.
+        with CacheSession() as session:
+            row = session.execute(
+                select(CachedResponse.body, CachedResponse.expires_time).where(CachedResponse.key == key)
+            ).first()
+        if row is None:
+            self.__count('misses')
+            return None
+        entry = CacheEntry(row.body, now < row.expires_time)
+        with self.__accesses_lock:
+            hits = self.__accesses.get(key, (now, 0))[1]
+            self.__accesses[key] = (now, hits + 1)
+
+        self.__count('hits' if entry.fresh else 'stale_hits')
+        return entry
+
+    def __write_accesses(self, session):
+        """Writes the access times and hit counts recorded since they were last written."""
+        with self.__accesses_lock:
+            accesses = self.__accesses
+            self.__accesses = {}
+        for key, (last_access_time, hits) in accesses.items():
+            session.execute(
+                update(CachedResponse)
+                .where(CachedResponse.key == key)
+                .values(last_access_time=last_access_time, hits=CachedResponse.hits + hits)
+            )
+
+    def put(self, key: str, body: bytes):
+        """Stores a response in the cache and evicts old entries if the cache has grown too large."""
+        now = time.time()
+        resource = self.resource_name(key)
+        with CacheSession.begin() as session:
+            self.__write_accesses(session)
+            cached = session.get(CachedResponse, key)
+            if cached is None:
+                cached = CachedResponse(key=key, resource=resource, hits=0)
+                session.add(cached)
+            cached.body = body
+            cached.size_bytes = len(body)
+            cached.stored_time = now
+            cached.expires_time = now + config.API_CACHE_TTL(resource)
+            cached.last_access_time = now
+        self.__count('stores')
+        self.evict()
+
+    def evict(self):
+        """Removes the least recently used entries until the cache is within its configured bounds."""
+        max_entries = config.API_CACHE_MAX_ENTRIES
+        max_size = config.API_CACHE_MAX_SIZE * 1000  # Kilobytes
+        with CacheSession.begin() as session:
+            # Evict by up to date access times
+            self.__write_accesses(session)
+            count, size = session.execute(
+                select(func.count(CachedResponse.key), func.coalesce(func.sum(CachedResponse.size_bytes), 0))
+            ).one()
+            if count <= max_entries and size <= max_size:
+                return
+
+            victims = []
+            for key, size_bytes in session.execute(
+                select(CachedResponse.key, CachedResponse.size_bytes)
+                .order_by(CachedResponse.last_access_time.asc())
+            ):
+                if count <= max_entries and size <= max_size:
+                    break
+                victims.append(key)
+                count -= 1
+                size -= size_bytes
+
+            # Delete in chunks to stay under SQLite's limit on bound parameters
+            for i in range(0, len(victims), 500):
+                session.execute(delete(CachedResponse).where(CachedResponse.key.in_(victims[i:i + 500])))
+
+        with self.__stats_lock:
+            self.evictions += len(victims)
+
+    def clear(self):
+        with self.__accesses_lock:
+            self.__accesses = {}
+        with CacheSession.begin() as session:
+            session.execute(delete(CachedResponse))
+
+    def dump(self):
+        with CacheSession.begin() as session:
+            count, size = session.execute(
+                select(func.count(CachedResponse.key), func.coalesce(func.sum(CachedResponse.size_bytes), 0))
+            ).one()
+        with self.__stats_lock:
+            return {
+                'entries': count,
+                'size_bytes': size,
+                'hits': self.hits,
+                'stale_hits': self.stale_hits,
+                'misses': self.misses,
+                'stores': self.stores,
+                'evictions': self.evictions
+            }
+
+
+CacheBase.metadata.create_all(cache_engine)
+
+response_cache = ResponseCache()
@@ -1,6 +1,8 @@
 from typing import Type
 
-from marshmallow import Schema, fields
+from marshmallow import Schema, fields, post_dump
+
+from server.progress import progress_tracker
 
 
 class Marshmallowable:
@@ -31,6 +33,7 @@ class DownloadSchema(Schema):
     start_time = fields.DateTime()
     finish_time = fields.DateTime()
     url = fields.Str()
+    priority = fields.Int()
     size_bytes = fields.Int(attribute='_size_bytes')
     '''Size of the downloadable data in bytes. Set when response_headers is set.'''
     downloaded_bytes = fields.Int()
@@ -39,6 +42,21 @@ class DownloadSchema(Schema):
     response_headers = fields.Str(attribute='_response_headers')
     '''Full set of headers returned with the download request as serialized JSON.'''
 
+    @post_dump
+    def add_live_progress(self, data, **kwargs):
+        """
+        Running downloads only write their progress to the database every few seconds. Report their live progress,
+        rate and estimated time remaining from memory instead.
+        """
+        progress = progress_tracker.get(data.get('id'))
+        data['rate_bytes'] = None
+        data['eta_seconds'] = None
+        if progress is not None:
+            data['downloaded_bytes'] = progress['downloaded_bytes']
+            data['rate_bytes'] = progress['rate_bytes']
+            data['eta_seconds'] = progress['eta_seconds']
+        return data
+
 
 class FileSchema(Schema):
     __tablename__ = 'file'
@@ -50,6 +68,9 @@ class FileSchema(Schema):
     path = fields.Str()
     size_bytes = fields.Int()
     content_type = fields.Str()
+    url = fields.Str()
+    content_hash = fields.Str()
+    hashed_mtime = fields.Float()
 
 
 class ImageSchema(Schema):
@@ -0,0 +1,51 @@
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from config import config
+
+reported_pragmas = ['journal_mode', 'synchronous', 'cache_size', 'mmap_size', 'temp_store', 'busy_timeout']
+'''The pragmas set from the database performance settings, in the order they are reported.'''
+
+
+def configured_pragmas() -> dict[str, any]:
+    """Returns the pragma values set from the database performance settings."""
+    return {
+        'journal_mode': config.DATABASE_JOURNAL_MODE,
+        'synchronous': config.DATABASE_SYNCHRONOUS,
+        # Negative values are in kibibytes rather than pages
+        'cache_size': -config.DATABASE_CACHE_SIZE,
+        'mmap_size': config.DATABASE_MMAP_SIZE * 1000 * 1000,
+        'temp_store': config.DATABASE_TEMP_STORE,
+        'busy_timeout': int(config.DATABASE_BUSY_TIMEOUT * 1000)
+    }
+
+
+def apply_pragmas(engine: Engine):
+    """
+    Sets the database performance settings on every connection the engine opens. Most pragmas only last as long as the
+    connection, so they are set whenever the pool opens a new one.
+    """
+    pragmas = configured_pragmas()
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name} = {value}')
+        finally:
+            cursor.close()
+
+
+def active_pragmas(engine: Engine) -> dict[str, any]:
+    """Reads back the pragma values in effect on a connection from the engine."""
+    with engine.connect() as connection:
+        cursor = connection.connection.cursor()
+        try:
+            values = {}
+            for name in reported_pragmas:
+                cursor.execute(f'PRAGMA {name}')
+                values[name] = cursor.fetchone()[0]
+            return values
+        finally:
+            cursor.close()